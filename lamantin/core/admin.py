@@ -8,6 +8,7 @@ from django.forms import CheckboxSelectMultiple
 from django.utils.safestring import mark_safe
 
 from lamantin.core.models import GenericChoice
+from lamantin.core.models import Outbox
 
 
 class GenericChoiceAdmin(admin.ModelAdmin):
@@ -21,4 +22,16 @@ class GenericChoiceAdmin(admin.ModelAdmin):
     }
 
 
+class OutboxAdmin(admin.ModelAdmin):
+    """Outbox admin class."""
+
+    list_display = (
+        'subject', 'status', 'attempts', 'next_attempt', 'sent_at', 'created_at',
+    )
+    list_filter = ('status',)
+    search_fields = ('subject',)
+    readonly_fields = ('created_at', 'updated_at', 'sent_at', 'last_error')
+
+
 admin.site.register(GenericChoice, GenericChoiceAdmin)
+admin.site.register(Outbox, OutboxAdmin)
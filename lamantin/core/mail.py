@@ -0,0 +1,253 @@
+# -*- coding: utf-8 -*-
+
+"""Outbound email queue: views enqueue, the send_outbox command delivers."""
+
+import datetime
+import logging
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.mail import EmailMessage
+from django.core.mail import get_connection
+from django.db import models
+from django.db import transaction
+from django.template import loader
+from django.utils import timezone
+from lamantin.core.models import MANAGER_EMAILS
+from lamantin.core.models import Outbox
+
+
+logger = logging.getLogger('debug_logfile')
+# model field values that survive the trip through JSON unchanged
+SCALARS = (str, int, float, bool, type(None))
+
+
+def pack(value):
+    """Reduce template data to JSON, keeping model instances by reference.
+
+    Attributes the views set on an instance before sending (to_list, note,
+    status and so on) are kept along with its primary key, so the worker
+    renders the same email the request would have.
+    """
+    if isinstance(value, models.Model):
+        fields = {field.attname for field in value._meta.concrete_fields}
+        attrs = {
+            key: pack(attr) for key, attr in vars(value).items()
+            if not key.startswith('_')
+            and (key not in fields or isinstance(attr, SCALARS))
+        }
+        return {
+            'model': value._meta.label_lower, 'pk': value.pk, 'attrs': attrs,
+        }
+    if isinstance(value, dict):
+        return {'dict': {key: pack(item) for key, item in value.items()}}
+    if isinstance(value, (list, tuple)):
+        return {'list': [pack(item) for item in value]}
+    return {'value': value}
+
+
+def unpack(value):
+    """Rebuild template data packed by pack()."""
+    if 'model' in value:
+        model = apps.get_model(value['model'])
+        instance = model._default_manager.filter(pk=value['pk']).first()
+        if instance is not None:
+            for key, attr in value['attrs'].items():
+                setattr(instance, key, unpack(attr))
+        return instance
+    if 'dict' in value:
+        return {key: unpack(item) for key, item in value['dict'].items()}
+    if 'list' in value:
+        return [unpack(item) for item in value['list']]
+    return value['value']
+
+
+def manager_emails():
+    """Email addresses of the manager group, cached until membership changes."""
+    emails = cache.get(MANAGER_EMAILS)
+    if emails is None:
+        emails = list(
+            User.objects.filter(
+                groups__name=settings.MANAGER_GROUP,
+            ).order_by('id').values_list('email', flat=True),
+        )
+        cache.set(MANAGER_EMAILS, emails, None)
+    return emails
+
+
+def queue_mail(recipients, subject, femail, template, data, bcc=None, reply_to=None, digest=None):
+    """Add an email to the outbox rather than sending it in the request.
+
+    With a digest key and OUTBOX_DIGEST_WINDOW set, the message waits out the
+    window and is sent together with any others queued for the same key and
+    recipients in the meantime.
+    """
+    message = Outbox(
+        recipients=list(recipients),
+        subject=subject,
+        from_email=femail,
+        template=template,
+        data=pack(data),
+        bcc=list(bcc or []),
+        reply_to=list(reply_to or []),
+    )
+    window = settings.OUTBOX_DIGEST_WINDOW
+    if digest and window:
+        message.digest = digest
+        message.next_attempt = timezone.now() + datetime.timedelta(seconds=window)
+        pending = Outbox.objects.filter(
+            status=Outbox.PENDING, digest=digest, attempts=0,
+        )
+        for queued in pending:
+            if queued.recipients == message.recipients and queued.bcc == message.bcc:
+                # join the open digest so that they are delivered together
+                message.next_attempt = queued.next_attempt
+                break
+    message.save()
+    return message
+
+
+def render_body(message):
+    """Render the template of an outbox entry."""
+    return loader.render_to_string(
+        message.template,
+        {'data': unpack(message.data), 'server_url': settings.SERVER_URL},
+    )
+
+
+def render(messages):
+    """Build one EmailMessage for an outbox entry or a digest of entries."""
+    last = messages[-1]
+    if len(messages) == 1:
+        subject = last.subject
+        body = render_body(last)
+    else:
+        subject = '{0} (and {1} earlier updates)'.format(
+            last.subject, len(messages) - 1,
+        )
+        body = loader.render_to_string(
+            'geoc/email_digest.html',
+            {
+                'entries': [(msg, render_body(msg)) for msg in messages],
+                'server_url': settings.SERVER_URL,
+            },
+        )
+    email = EmailMessage(
+        subject,
+        body,
+        last.from_email,
+        last.recipients,
+        bcc=last.bcc,
+        reply_to=last.reply_to,
+    )
+    email.content_subtype = 'html'
+    return email
+
+
+def claim(batch, lease):
+    """Lease a batch of due messages to this worker and return them.
+
+    The rows are locked with SKIP LOCKED only while their next attempt is
+    moved lease seconds ahead, so overlapping workers never pick the same
+    message and no lock is held while mail is sent. A digest in the batch
+    brings all of its due messages along. A worker that dies
+    mid-batch leaves its messages to be retried when the lease runs out.
+    """
+    with transaction.atomic():
+        queue = list(
+            Outbox.objects.due().select_for_update(skip_locked=True)[:batch],
+        )
+        digests = {message.digest for message in queue if message.digest}
+        if digests:
+            # a digest goes out whole, however many batches it spans
+            pending = Outbox.objects.due().filter(digest__in=digests)
+            queue.extend(pending.exclude(
+                id__in=[message.id for message in queue],
+            ).select_for_update(skip_locked=True))
+            # rows still unclaimed are locked by another worker: leave the
+            # digest to a later run rather than send it in two parts
+            busy = set(pending.exclude(
+                id__in=[message.id for message in queue],
+            ).values_list('digest', flat=True))
+            queue = sorted(
+                (message for message in queue if message.digest not in busy),
+                key=lambda message: (message.next_attempt, message.id),
+            )
+        if queue:
+            Outbox.objects.filter(id__in=[message.id for message in queue]).update(
+                next_attempt=timezone.now() + datetime.timedelta(seconds=lease),
+            )
+    return queue
+
+
+def deliver(batch=None, attempts=None, backoff=None):
+    """Send one batch of due messages and return (sent, failed) counts.
+
+    A failed message is retried after backoff * 2 ** (attempts - 1) seconds
+    and marked as failed once it runs out of attempts. Messages are claimed
+    before sending and the outcome is recorded afterwards, each in a short
+    transaction of its own, see claim().
+    """
+    if batch is None:
+        batch = settings.OUTBOX_BATCH_SIZE
+    if attempts is None:
+        attempts = settings.OUTBOX_MAX_ATTEMPTS
+    if backoff is None:
+        backoff = settings.OUTBOX_BACKOFF
+    sent = failed = 0
+    queue = claim(batch, settings.OUTBOX_LEASE)
+    if not queue:
+        return sent, failed
+    connection = get_connection()
+    try:
+        connection.open()
+    except Exception as error:
+        # each message below retries the connection and records the error
+        logger.debug('outbox connection: {0}'.format(error))
+    # digest entries for the same key and recipients go out as one email
+    batches = {}
+    for message in queue:
+        key = message.id
+        if message.digest:
+            key = (message.digest, str(message.recipients), str(message.bcc))
+        batches.setdefault(key, []).append(message)
+    try:
+        for messages in batches.values():
+            for message in messages:
+                message.attempts += 1
+            try:
+                email = render(messages)
+                email.connection = connection
+                email.send()
+            except Exception as error:
+                failed += len(messages)
+                for message in messages:
+                    message.last_error = repr(error)
+                    if message.attempts >= attempts:
+                        message.status = Outbox.FAILED
+                    else:
+                        message.next_attempt = timezone.now() + datetime.timedelta(
+                            seconds=backoff * 2 ** (message.attempts - 1),
+                        )
+                logger.debug('outbox {0} attempt {1}: {2}'.format(
+                    [message.id for message in messages],
+                    messages[-1].attempts,
+                    error,
+                ))
+            else:
+                sent += len(messages)
+                for message in messages:
+                    message.status = Outbox.SENT
+                    message.sent_at = timezone.now()
+                    message.last_error = ''
+    finally:
+        connection.close()
+        with transaction.atomic():
+            for message in queue:
+                message.save(update_fields=[
+                    'status', 'attempts', 'next_attempt', 'sent_at',
+                    'last_error', 'updated_at',
+                ])
+    return sent, failed
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+
+"""Deliver queued outbound email."""
+
+from django.core.management.base import BaseCommand
+from lamantin.core.mail import deliver
+
+
+class Command(BaseCommand):
+    """Render and send due outbox messages in batches; run from cron."""
+
+    help = 'Render and send due outbox messages, retrying failures with backoff.'
+
+    def add_arguments(self, parser):
+        """Batch size and retry policy, defaulting to the OUTBOX settings."""
+        parser.add_argument('--batch', type=int, default=None)
+        parser.add_argument('--attempts', type=int, default=None)
+        parser.add_argument('--backoff', type=int, default=None)
+
+    def handle(self, *args, **options):
+        """Drain the queue one batch at a time."""
+        total_sent = total_failed = 0
+        while True:
+            sent, failed = deliver(
+                batch=options['batch'],
+                attempts=options['attempts'],
+                backoff=options['backoff'],
+            )
+            total_sent += sent
+            total_failed += failed
+            if not sent + failed:
+                break
+        self.stdout.write('sent: {0}, failed: {1}'.format(total_sent, total_failed))
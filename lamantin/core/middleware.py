@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+
+"""Request instrumentation: query counts, timings and per-view budgets."""
+
+import contextlib
+import contextvars
+import json
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.template.backends.django import Template
+
+
+logger = logging.getLogger('debug_logfile')
+# counters for the request being handled in the current thread or task
+STATS = contextvars.ContextVar('lamantin_request_stats', default=None)
+MISSING = object()
+
+
+def timed_render(render):
+    """Add the time spent rendering outermost templates to the request."""
+    def wrapper(self, *args, **kwargs):
+        stats = STATS.get()
+        if stats is None or stats['depth']:
+            return render(self, *args, **kwargs)
+        stats['depth'] += 1
+        start = time.perf_counter()
+        try:
+            return render(self, *args, **kwargs)
+        finally:
+            stats['depth'] -= 1
+            stats['template'] += time.perf_counter() - start
+    wrapper.instrumented = True
+    return wrapper
+
+
+def counted_get(get):
+    """Count cache hits and misses for the request."""
+    def wrapper(self, key, default=None, version=None):
+        value = get(self, key, MISSING, version=version)
+        stats = STATS.get()
+        if stats is not None and not stats['bulk']:
+            stats['hits' if value is not MISSING else 'misses'] += 1
+        return default if value is MISSING else value
+    wrapper.instrumented = True
+    return wrapper
+
+
+def counted_get_many(get_many):
+    """Count a cache hit or miss for each key of a bulk read."""
+    def wrapper(self, keys, version=None):
+        stats = STATS.get()
+        if stats is None or stats['bulk']:
+            return get_many(self, keys, version=version)
+        keys = list(keys)
+        # backends without a get_many of their own call get for each key
+        stats['bulk'] = True
+        try:
+            found = get_many(self, keys, version=version)
+        finally:
+            stats['bulk'] = False
+        stats['hits'] += len(found)
+        stats['misses'] += len(keys) - len(found)
+        return found
+    wrapper.instrumented = True
+    return wrapper
+
+
+def instrument():
+    """Wrap template rendering and cache reads, once per process."""
+    if not getattr(Template.render, 'instrumented', False):
+        Template.render = timed_render(Template.render)
+    for alias in settings.CACHES:
+        backend = type(caches[alias])
+        if not getattr(backend.get, 'instrumented', False):
+            backend.get = counted_get(backend.get)
+        if not getattr(backend.get_many, 'instrumented', False):
+            backend.get_many = counted_get_many(backend.get_many)
+
+
+class QueryBudgetMiddleware:
+    """Log SQL, template and cache statistics for every resolved view.
+
+    Enabled with LAMANTIN_INSTRUMENTATION; when it is off the middleware
+    removes itself at startup and costs nothing. LAMANTIN_QUERY_BUDGETS maps
+    a URL name to a query count, or to a dict of limits on any of the logged
+    numbers ('queries', 'db_ms', 'template_ms', 'total_ms'), and a warning is
+    logged when a view goes over. Template time includes queries run lazily
+    from the template.
+    """
+
+    def __init__(self, get_response):
+        """Install the hooks or bow out if instrumentation is off."""
+        if not settings.LAMANTIN_INSTRUMENTATION:
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        instrument()
+
+    def __call__(self, request):
+        """Collect the numbers around the rest of the request cycle."""
+        stats = {
+            'queries': 0, 'db': 0.0, 'template': 0.0, 'depth': 0,
+            'hits': 0, 'misses': 0, 'bulk': False,
+        }
+        token = STATS.set(stats)
+        start = time.perf_counter()
+        try:
+            with contextlib.ExitStack() as stack:
+                for alias in connections:
+                    stack.enter_context(
+                        connections[alias].execute_wrapper(self.execute),
+                    )
+                response = self.get_response(request)
+        finally:
+            STATS.reset(token)
+        self.report(request, response, stats, time.perf_counter() - start)
+        return response
+
+    def execute(self, execute, sql, params, many, context):
+        """Count and time each query."""
+        stats = STATS.get()
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            if stats is not None:
+                stats['queries'] += 1
+                stats['db'] += time.perf_counter() - start
+
+    def report(self, request, response, stats, elapsed):
+        """Write the structured record and check the view budget."""
+        match = request.resolver_match
+        view = match.view_name if match else None
+        record = {
+            'view': view,
+            'path': request.path,
+            'method': request.method,
+            'status': response.status_code,
+            'queries': stats['queries'],
+            'db_ms': round(stats['db'] * 1000, 2),
+            'template_ms': round(stats['template'] * 1000, 2),
+            'total_ms': round(elapsed * 1000, 2),
+            'cache_hits': stats['hits'],
+            'cache_misses': stats['misses'],
+        }
+        logger.debug(json.dumps(record, sort_keys=True))
+        budget = settings.LAMANTIN_QUERY_BUDGETS.get(view)
+        if budget is None:
+            return
+        if not isinstance(budget, dict):
+            budget = {'queries': budget}
+        over = {
+            key: limit for key, limit in budget.items()
+            if record.get(key, 0) > limit
+        }
+        if over:
+            logger.warning('view over budget: {0}'.format(
+                json.dumps({'budget': over, 'record': record}, sort_keys=True),
+            ))
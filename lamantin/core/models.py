@@ -2,10 +2,23 @@
 
 """Data models."""
 
+from django.contrib.auth.models import Group
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
+from django.db.models.signals import m2m_changed
+from django.db.models.signals import post_delete
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django.utils import timezone
 from taggit.managers import TaggableManager
 
 
+# cache key for the manager group email addresses, see core.mail
+MANAGER_EMAILS = 'core_manager_emails'
+
+
 class GenericChoice(models.Model):
     """Choices for model and form fields that accept for multiple values."""
 
@@ -41,3 +54,76 @@ class GenericChoice(models.Model):
     def __str__(self):
         """Default data for display."""
         return self.name
+
+
+class OutboxQuerySet(models.QuerySet):
+    """Query helpers for the outbound email queue."""
+
+    def due(self):
+        """Pending messages whose next delivery attempt is now or past."""
+        return self.filter(
+            status=Outbox.PENDING,
+            next_attempt__lte=timezone.now(),
+        ).order_by('next_attempt', 'id')
+
+
+class Outbox(models.Model):
+    """Outbound email waiting to be rendered and delivered by the worker."""
+
+    PENDING = 'pending'
+    SENT = 'sent'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (PENDING, 'Pending'),
+        (SENT, 'Sent'),
+        (FAILED, 'Failed'),
+    )
+
+    created_at = models.DateTimeField("Date Created", auto_now_add=True)
+    updated_at = models.DateTimeField("Date Updated", auto_now=True)
+    subject = models.CharField(max_length=255)
+    from_email = models.CharField(max_length=255)
+    recipients = models.JSONField(default=list)
+    bcc = models.JSONField(default=list, blank=True)
+    reply_to = models.JSONField(default=list, blank=True)
+    template = models.CharField(max_length=255)
+    digest = models.CharField(
+        max_length=64,
+        blank=True,
+        help_text="Messages sharing a digest key and recipients are sent as one.",
+    )
+    data = models.JSONField(default=dict, encoder=DjangoJSONEncoder)
+    status = models.CharField(
+        max_length=16, choices=STATUS_CHOICES, default=PENDING,
+    )
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt = models.DateTimeField(default=timezone.now)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+
+    objects = OutboxQuerySet.as_manager()
+
+    class Meta:
+        """Attributes about the data model and admin options."""
+
+        verbose_name_plural = 'Outbox'
+        ordering = ['-created_at']
+        indexes = [models.Index(fields=['status', 'next_attempt'])]
+
+    def __str__(self):
+        """Default data for display."""
+        return self.subject
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def manager_emails_changed(sender, **kwargs):
+    """Drop the cached manager addresses when users or groups change."""
+    if not kwargs.get('action', 'post_').startswith('post_'):
+        return
+    if kwargs.get('update_fields') == frozenset(['last_login']):
+        return
+    cache.delete(MANAGER_EMAILS)
@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+
+"""Group based permission checks."""
+
+from django.conf import settings
+
+
+def user_groups(user):
+    """Map a user's group ids to names, loaded once per request.
+
+    The map is kept on the user object, which Django builds afresh for
+    every request, so it never outlives a change of membership for long.
+    """
+    if not hasattr(user, '_lamantin_groups'):
+        groups = {}
+        if user.is_authenticated:
+            groups = dict(user.groups.values_list('id', 'name'))
+        user._lamantin_groups = groups
+    return user._lamantin_groups
+
+
+def in_groups(user, *names):
+    """Whether the user belongs to any of the named groups."""
+    return not set(names).isdisjoint(user_groups(user).values())
+
+
+def is_manager(user):
+    """Whether the user is on the GEOC committee manager group."""
+    return in_groups(user, settings.MANAGER_GROUP)
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+
+"""Hand protected file transfers to the web server, or stream them."""
+
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse
+from django.http import HttpResponse
+from django.utils.http import content_disposition_header
+
+
+# a single byte range; anything else gets the whole file
+RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class FileRange:
+    """Part of an open file, read by FileResponse like a whole one."""
+
+    def __init__(self, phile, start, length):
+        """Position the file at the first byte of the range."""
+        phile.seek(start)
+        self.phile = phile
+        self.remaining = length
+
+    def read(self, size=-1):
+        """Read no further than the end of the range."""
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.phile.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        """Close the underlying file."""
+        self.phile.close()
+
+
+def byte_range(header, size):
+    """(start, end) of a Range header, None for the whole file.
+
+    Raises ValueError when the range cannot be satisfied.
+    """
+    match = RANGE.match(header or '')
+    if not match or not size:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # the last N bytes
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start > end or start >= size:
+        raise ValueError('unsatisfiable range: {0}'.format(header))
+    return start, end
+
+
+def send_file(request, phile, filename):
+    """Response that sends a stored file, offloaded if configured.
+
+    With DOCUMENT_SENDFILE set to X-Accel-Redirect (nginx) or X-Sendfile
+    (Apache, lighttpd) Django only answers with the header and the web server
+    transfers the bytes, ranges included. Otherwise the file is streamed with
+    FileResponse, honouring a single byte range.
+    """
+    disposition = content_disposition_header(False, filename)
+    content_type = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    header = settings.DOCUMENT_SENDFILE
+    if header:
+        response = HttpResponse(content_type=content_type)
+        if header == 'X-Accel-Redirect':
+            response[header] = quote(
+                '{0}{1}'.format(settings.DOCUMENT_ACCEL_PREFIX, phile.name),
+            )
+        else:
+            response[header] = phile.path
+        response['Content-Disposition'] = disposition
+        return response
+    size = os.path.getsize(phile.path)
+    try:
+        span = byte_range(request.headers.get('Range'), size)
+    except ValueError:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = 'bytes */{0}'.format(size)
+        return response
+    handle = open(phile.path, 'rb')
+    if span is None:
+        response = FileResponse(handle, content_type=content_type)
+    else:
+        start, end = span
+        response = FileResponse(
+            FileRange(handle, start, end - start + 1),
+            status=206,
+            content_type=content_type,
+        )
+        response['Content-Length'] = end - start + 1
+        response['Content-Range'] = 'bytes {0}-{1}/{2}'.format(start, end, size)
+    response['Accept-Ranges'] = 'bytes'
+    response['Content-Disposition'] = disposition
+    return response
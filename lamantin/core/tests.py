@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+
+"""Delivery of the outbound email queue."""
+
+from unittest import mock
+
+from django.core import mail
+from django.test import TestCase
+from django.test import override_settings
+from django.utils import timezone
+from lamantin.core.mail import claim
+from lamantin.core.mail import deliver
+from lamantin.core.mail import queue_mail
+from lamantin.core.models import Outbox
+
+
+# what the locmem backend raises for a mail server that is down
+DOWN = mock.patch(
+    'django.core.mail.backends.locmem.EmailBackend.send_messages',
+    side_effect=OSError('connection refused'),
+)
+
+
+def note(recipients=('faculty@example.com',), digest=None):
+    """Queue a comment notice like the ones the dashboard sends."""
+    return queue_mail(
+        list(recipients),
+        '[GEOC] New comment',
+        'geoc@example.com',
+        'dashboard/email_note.html',
+        {'id': 1, 'title': 'World History', 'number': 'HIS 1000', 'body': 'Looks good.'},
+        digest=digest,
+    )
+
+
+def make_due():
+    """Bring every pending message forward to now."""
+    Outbox.objects.update(next_attempt=timezone.now())
+
+
+class OutboxTest(TestCase):
+    """The send_outbox worker, run against django.core.mail.outbox."""
+
+    def test_queue(self):
+        """Queued mail is sent by the worker, not by the request."""
+        note()
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(deliver(), (1, 0))
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ['faculty@example.com'])
+        self.assertIn('Looks good.', mail.outbox[0].body)
+        message = Outbox.objects.get()
+        self.assertEqual(message.status, Outbox.SENT)
+        self.assertIsNotNone(message.sent_at)
+        self.assertEqual(deliver(), (0, 0))
+
+    def test_retry(self):
+        """A failed message is retried after its backoff, then given up on."""
+        note()
+        with DOWN:
+            self.assertEqual(deliver(attempts=2, backoff=60), (0, 1))
+        message = Outbox.objects.get()
+        self.assertEqual(message.status, Outbox.PENDING)
+        self.assertEqual(message.attempts, 1)
+        self.assertIn('connection refused', message.last_error)
+        self.assertGreater(message.next_attempt, timezone.now())
+        # still backing off
+        self.assertEqual(deliver(attempts=2, backoff=60), (0, 0))
+        make_due()
+        with DOWN:
+            self.assertEqual(deliver(attempts=2, backoff=60), (0, 1))
+        message.refresh_from_db()
+        self.assertEqual(message.status, Outbox.FAILED)
+        self.assertEqual(message.attempts, 2)
+        make_due()
+        self.assertEqual(deliver(), (0, 0))
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_no_backoff(self):
+        """A backoff of 0 makes a failed message due again at once."""
+        note()
+        with DOWN:
+            self.assertEqual(deliver(backoff=0), (0, 1))
+        self.assertEqual(deliver(backoff=0), (1, 0))
+        self.assertEqual(Outbox.objects.get().attempts, 2)
+
+    def test_lease(self):
+        """Claimed messages are not due for another worker."""
+        note()
+        self.assertEqual(len(claim(10, 60)), 1)
+        self.assertEqual(deliver(), (0, 0))
+        self.assertEqual(len(mail.outbox), 0)
+
+    @override_settings(OUTBOX_DIGEST_WINDOW=600)
+    def test_digest(self):
+        """Notices for one digest and recipients go out as a single email."""
+        for count in range(3):
+            note(digest='course-1')
+        note(recipients=['chair@example.com'], digest='course-1')
+        note(digest='course-2')
+        self.assertEqual(deliver(), (0, 0))
+        make_due()
+        # the batch ends inside the digest, which is still sent whole
+        self.assertEqual(deliver(batch=1), (4, 0))
+        self.assertEqual(len(mail.outbox), 2)
+        digest = [email for email in mail.outbox if email.to == ['faculty@example.com']]
+        self.assertEqual(len(digest), 1)
+        self.assertIn('and 2 earlier updates', digest[0].subject)
+        self.assertEqual(deliver(batch=1), (1, 0))
+        self.assertEqual(len(mail.outbox), 3)
@@ -12,5 +12,10 @@ urlpatterns = [
         views.courses,
         name='courses',
     ),
+    path(
+        'outcome/<int:oid>/courses/data/',
+        views.course_data,
+        name='outcome_course_data',
+    ),
     path('', views.home, name='designation_home'),
 ]
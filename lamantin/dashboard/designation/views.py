@@ -3,34 +3,62 @@
 """URLs for all views."""
 
 from django.conf import settings
+from django.db.models import Case
+from django.db.models import Count
+from django.db.models import F
+from django.db.models import FloatField
+from django.db.models import Prefetch
+from django.db.models import Q
+from django.db.models import Value
+from django.db.models import When
+from django.db.models.functions import Round
 from django.shortcuts import get_object_or_404
 from django.shortcuts import render
 from django.urls import reverse_lazy
 from djtools.decorators.auth import group_required
+from lamantin.dashboard.views import datatable
 from lamantin.geoc.models import Course
 from lamantin.geoc.models import Outcome
 
 
+# sortable DataTables columns for the designation table, in display order
+DESIGNATION_COLUMNS = ('number', 'title', None, None, 'approved', 'status')
+
+
+def outcome_stats(outcomes):
+    """Annotate outcomes with their course counts in a single query."""
+    return outcomes.annotate(
+        total=Count('course_outcomes'),
+        confirmed=Count(
+            'course_outcomes',
+            filter=Q(course_outcomes__course__status='Confirmed'),
+        ),
+    ).annotate(
+        provisional=F('total') - F('confirmed'),
+        percent=Case(
+            When(total=0, then=Value(0.0)),
+            default=Round(100.0 * F('confirmed') / F('total'), 2),
+            output_field=FloatField(),
+        ),
+    )
+
+
 @group_required(settings.MANAGER_GROUP)
 def home(request):
     """GEOC dashboard for designations."""
-    outcomes = Outcome.objects.all()
-    courses = Course.objects.all()
-    confirmed = 0
-    provisional = 0
-    for course in courses:
-        if course.status == 'Confirmed':
-            confirmed += 1
-        else:
-            provisional += 1
+    outcomes = outcome_stats(Outcome.objects.all())
+    totals = Course.objects.aggregate(
+        total=Count('id'),
+        confirmed=Count('id', filter=Q(status='Confirmed')),
+    )
     return render(
         request,
         'dashboard/designation/home.html',
         {
             'outcomes': outcomes,
-            'courses': courses,
-            'confirmed': confirmed,
-            'provisional': provisional,
+            'total': totals['total'],
+            'confirmed': totals['confirmed'],
+            'provisional': totals['total'] - totals['confirmed'],
         },
     )
 
@@ -38,22 +66,31 @@ def home(request):
 @group_required(settings.MANAGER_GROUP)
 def courses(request, oid):
     """GEOC courses for a given student learning outcome."""
-    outcome = get_object_or_404(Outcome, pk=oid)
-    courses = Course.objects.filter(outcome__id=oid)
-    confirmed = 0
-    percent = 0
-    for course in courses:
-        if course.status == 'Confirmed':
-            confirmed += 1
-    if courses.count() > 0:
-        percent = round(confirmed / courses.count() * 100, 2)
+    outcome = get_object_or_404(outcome_stats(Outcome.objects.all()), pk=oid)
     return render(
         request,
         'dashboard/designation/courses.html',
         {
-            'courses': courses,
             'outcome': outcome,
-            'confirmed': confirmed,
-            'percent': percent,
+            'total': outcome.total,
+            'confirmed': outcome.confirmed,
+            'percent': outcome.percent,
         },
     )
+
+
+@group_required(settings.MANAGER_GROUP)
+def course_data(request, oid):
+    """Course table rows for an outcome via DataTables server-side ajax."""
+    outcome = get_object_or_404(Outcome, pk=oid)
+    courses = Course.objects.filter(outcome=outcome).prefetch_related(
+        'cross_listing',
+        Prefetch('outcome', queryset=Outcome.objects.select_related('group')),
+    )
+    return datatable(
+        request,
+        courses,
+        'dashboard/designation/row.inc.html',
+        DESIGNATION_COLUMNS,
+        outcome_index=True,
+    )
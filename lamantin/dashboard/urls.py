@@ -29,12 +29,26 @@ urlpatterns = [
     path('course/<int:cid>/furbish/', views.furbish, name='furbish'),
     # phile upload
     path('course/phile/', views.phile_upload, name='phile_upload'),
+    # course documents and their previews, for those who may see the course
+    path('course/document/<int:did>/', views.document, name='document'),
+    path(
+        'course/document/<int:did>/preview/',
+        views.document,
+        {'preview': True},
+        name='document_preview',
+    ),
+    # resumable upload, one part at a time
+    path('course/phile/chunk/', views.phile_chunk, name='phile_chunk'),
     # manager course comments
     path('course/annotation/', views.annotation, name='annotation'),
     # course status view for 'approved'
     path('course/status/', views.status, name='status'),
     # course status view for 'approved'
     path('outcome/status/', views.outcome_status, name='outcome_status'),
+    # course table rows for datatables server-side processing
+    path('course/data/', views.course_data, name='course_data'),
+    # registrar export of the course catalogue
+    path('course/export/<str:fmt>/', views.export, name='export'),
     # designations
     path('designation/', include('lamantin.dashboard.designation.urls')),
     # home
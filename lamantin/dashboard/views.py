@@ -2,62 +2,369 @@
 
 """URLs for all views."""
 
+import csv
 import datetime
+import hashlib
 import json
 import logging
+import os
+import tempfile
 
 from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.db.models import prefetch_related_objects
+from django.http import FileResponse
 from django.http import HttpResponse
+from django.http import HttpResponseBadRequest
 from django.http import HttpResponseRedirect
 from django.http import Http404
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django.shortcuts import render
 from django.template import loader
+from django.template.loader import render_to_string
+from django.urls import reverse
 from django.urls import reverse_lazy
+from django.utils.text import slugify
+from django.views.decorators.cache import cache_control
 from django.views.decorators.csrf import csrf_exempt
-from djtools.utils.mail import send_mail
-from djtools.utils.users import in_group
+from django.views.decorators.http import condition
 from djtools.decorators.auth import group_required
+from lamantin.core.mail import queue_mail
+from lamantin.core.permissions import is_manager
+from lamantin.core.permissions import user_groups
+from lamantin.core.sendfile import send_file
 from lamantin.geoc.forms import AnnotationForm
 from lamantin.geoc.forms import DocumentRequiredForm
 from lamantin.geoc.models import Annotation
 from lamantin.geoc.models import Course
+from lamantin.geoc.models import CourseOutcome
+from lamantin.geoc.models import Document
+from lamantin.geoc.models import OUTCOME_TAGS_VERSION
 from lamantin.geoc.models import Outcome
 from lamantin.geoc.models import OutcomeCourse
+from lamantin.geoc.models import OutcomeElement
+from lamantin.geoc.models import course_versions
+from lamantin.geoc.models import tag_kind
+from lamantin.geoc.uploads import append_chunk
+from lamantin.geoc.uploads import finish_upload
+from lamantin.geoc.uploads import partial_path
+from lamantin.geoc.uploads import partial_size
 
 
 logger = logging.getLogger('debug_logfile')
 
 
+# columns of the registrar export, one row per course
+EXPORT_HEADERS = (
+    'ID',
+    'Number',
+    'Title',
+    'Faculty',
+    'Email',
+    'Cross-listings',
+    'Outcomes',
+    'Outcome approval',
+    'Submitted',
+    'Approved',
+    'Approved date',
+    'Needs work',
+    'Status',
+    'Confirmed date',
+    'Archived',
+    'Syllabus',
+)
+# sortable DataTables columns for the course tables, in display order
+COURSE_COLUMNS = (
+    'title',
+    'number',
+    None,
+    None,
+    'user__last_name',
+    'created_at',
+    None,
+    'save_submit',
+    'approved',
+)
+
+
+def course_queryset(user, manager, show=None):
+    """Courses visible to a user on the dashboard, filtered by 'show'."""
+    courses = Course.objects.listing()
+    if manager:
+        if show == 1:
+            courses = courses.filter(archive=True)
+        elif show:
+            courses = courses.filter(outcome__id=show).filter(archive=False)
+        else:
+            courses = courses.filter(archive=False)
+    else:
+        courses = courses.filter(user=user).filter(archive=False)
+    return courses
+
+
+def datatable(request, courses, template, columns, outcome_index=False):
+    """Respond to a DataTables server-side request for a course queryset."""
+    get = request.GET
+    try:
+        draw = int(get.get('draw', 0))
+        start = max(int(get.get('start', 0)), 0)
+        length = int(get.get('length', 100))
+        column = int(get.get('order[0][column]', 0))
+    except ValueError:
+        return HttpResponseBadRequest("Invalid paging or ordering parameters")
+    total = courses.count()
+    filtered = total
+    search = get.get('search[value]', '').strip()
+    if search:
+        courses = courses.filter(
+            Q(title__icontains=search) |
+            Q(number__icontains=search) |
+            Q(user__last_name__icontains=search) |
+            Q(user__first_name__icontains=search),
+        )
+        filtered = courses.count()
+    if 0 <= column < len(columns) and columns[column]:
+        field = columns[column]
+        if get.get('order[0][dir]') == 'desc':
+            field = '-{0}'.format(field)
+        # tie-break on the primary key so that paging is stable
+        courses = courses.order_by(field, 'id')
+    if length > 0:
+        page = courses[start:start + length]
+    else:
+        page = courses[start:]
+    ids = list(page.values_list('id', flat=True))
+    # rows are cached per course under its version stamp; only the courses
+    # that changed since they were last rendered are fetched and rendered.
+    tags = cache.get(OUTCOME_TAGS_VERSION)
+    keys = {
+        cid: 'dashboard_row_{0}_{1}_{2}_{3}'.format(
+            template.replace('/', '_'), cid, version, tags,
+        )
+        for cid, version in course_versions(ids).items()
+    }
+    rows = cache.get_many(keys.values())
+    missing = [cid for cid in ids if keys[cid] not in rows]
+    if missing:
+        courses = list(courses.filter(id__in=missing))
+        context = {}
+        if outcome_index:
+            context['outcome_index'] = OutcomeCourse.index(courses)
+        rendered = {}
+        for course in courses:
+            context['course'] = course
+            rendered[keys[course.id]] = render_to_string(
+                template, context, request,
+            ).strip()
+        cache.set_many(rendered, settings.DASHBOARD_ROW_CACHE_TIMEOUT)
+        rows.update(rendered)
+    data = {
+        'draw': draw,
+        'recordsTotal': total,
+        'recordsFiltered': filtered,
+        'data': [rows[keys[cid]] for cid in ids],
+    }
+    return HttpResponse(
+        json.dumps(data), content_type='application/json; charset=utf-8',
+    )
+
+
+def conditional(request):
+    """Whether a page view may be answered with 304 Not Modified.
+
+    Only plain GETs qualify, and not while flash messages are waiting to be
+    shown on the page. Both pages embed a CSRF token, so there must already
+    be a CSRF secret; without one rendering the page would create a new one.
+    """
+    return (
+        request.method in ('GET', 'HEAD') and
+        'CSRF_COOKIE' in request.META and
+        not len(messages.get_messages(request))
+    )
+
+
+def viewer(request):
+    """The session and CSRF secret a page is rendered for.
+
+    Logging in again rotates both, so a page the browser kept from before
+    never revalidates with a token that is no longer accepted.
+    """
+    return '{0}:{1}'.format(
+        request.session.session_key, request.META['CSRF_COOKIE'],
+    )
+
+
+def page_etag(*parts):
+    """Hash the things a page depends on into an ETag."""
+    return hashlib.md5(
+        ':'.join(str(part) for part in parts).encode('utf-8'),
+    ).hexdigest()
+
+
+def home_etag(request):
+    """The dashboard shell depends on the viewer and the outcome list."""
+    if not conditional(request):
+        return None
+    return page_etag(
+        viewer(request),
+        request.user.pk,
+        is_manager(request.user),
+        cache.get(OUTCOME_TAGS_VERSION),
+    )
+
+
+def detail_modified(request, cid):
+    """Latest change to a course page, looked up once per request."""
+    if not conditional(request):
+        return None
+    if not hasattr(request, 'course_modified'):
+        request.course_modified = Course.objects.filter(pk=cid).last_modified()
+    return request.course_modified
+
+
+def detail_etag(request, cid):
+    """ETag for the course detail page.
+
+    Besides the viewer, their groups and the course timestamps it takes in
+    the course version stamp, which also covers SLO text, outcome edits and
+    cross-listings. There is deliberately no Last-Modified validator:
+    If-Modified-Since alone cannot tell that the viewer logged in again since.
+    """
+    modified = detail_modified(request, cid)
+    if modified is None:
+        return None
+    return page_etag(
+        viewer(request),
+        cid,
+        request.user.pk,
+        sorted(user_groups(request.user)),
+        modified.isoformat(),
+        course_versions([cid])[cid],
+        cache.get(OUTCOME_TAGS_VERSION),
+    )
+
+
+class Echo:
+    """File-like object that hands back what is written, for csv.writer."""
+
+    def write(self, value):
+        """Return the line instead of buffering it."""
+        return value
+
+
+def export_row(course):
+    """One course of the registrar export."""
+    def state(oc):
+        if course.approved or oc.approved:
+            return 'Approved'
+        if course.furbish or oc.furbish:
+            return 'Needs work'
+        return 'Pending'
+
+    syllabus = ''
+    if course.syllabus_doc:
+        syllabus = 'https://{0}{1}'.format(
+            settings.SERVER_URL, reverse('document', args=[course.syllabus_doc]),
+        )
+    return [
+        course.id,
+        course.number,
+        course.title,
+        '{0}, {1}'.format(course.user.last_name, course.user.first_name),
+        course.user.email,
+        '; '.join(cl.number for cl in course.cross_listing.all()),
+        '; '.join(oc.outcome.name for oc in course.outcome_courses),
+        '; '.join(
+            '{0}: {1}'.format(oc.outcome.name, state(oc))
+            for oc in course.outcome_courses
+        ),
+        'Yes' if course.save_submit else 'No',
+        'Yes' if course.approved else 'No',
+        course.approved_date,
+        'Yes' if course.furbish else 'No',
+        course.status or '',
+        course.confirmed_date,
+        'Yes' if course.archive else 'No',
+        syllabus,
+    ]
+
+
+def export_rows():
+    """Header and course rows of the registrar export.
+
+    Courses are read EXPORT_CHUNK_SIZE at a time, keyed on the primary key,
+    with the table row prefetches done per chunk, so memory stays flat however
+    large the catalogue is. Paging by key rather than holding a server-side
+    cursor open keeps that true on MySQL, whose driver buffers whole result
+    sets.
+    """
+    yield list(EXPORT_HEADERS)
+    courses = Course.objects.listing().order_by('id')
+    last = 0
+    while True:
+        chunk = list(courses.filter(id__gt=last)[:settings.EXPORT_CHUNK_SIZE])
+        for course in chunk:
+            yield export_row(course)
+        if len(chunk) < settings.EXPORT_CHUNK_SIZE:
+            break
+        last = chunk[-1].id
+
+
+@group_required(settings.MANAGER_GROUP)
+def export(request, fmt):
+    """Stream the course catalogue to the registrar as CSV or XLSX."""
+    filename = 'geoc_courses_{0}.{1}'.format(
+        datetime.date.today().strftime('%Y%m%d'), fmt,
+    )
+    if fmt == 'csv':
+        writer = csv.writer(Echo())
+        response = StreamingHttpResponse(
+            (writer.writerow(row) for row in export_rows()),
+            content_type='text/csv; charset=utf-8',
+        )
+        response['Content-Disposition'] = 'attachment; filename="{0}"'.format(
+            filename,
+        )
+    elif fmt == 'xlsx':
+        import xlsxwriter
+        # constant memory mode flushes each row to disk as it is written;
+        # the finished workbook is then streamed from a temporary file.
+        phile = tempfile.TemporaryFile()
+        workbook = xlsxwriter.Workbook(
+            phile,
+            {'constant_memory': True, 'default_date_format': 'yyyy-mm-dd'},
+        )
+        sheet = workbook.add_worksheet('Courses')
+        for index, row in enumerate(export_rows()):
+            sheet.write_row(index, 0, row)
+        workbook.close()
+        phile.seek(0)
+        response = FileResponse(phile, as_attachment=True, filename=filename)
+    else:
+        raise Http404
+    return response
+
+
 @login_required
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=home_etag)
 def home(request):
     """GEOC dashboard."""
     user = request.user
-    manager = in_group(user, settings.MANAGER_GROUP)
-    courses = None
+    manager = is_manager(user)
     show = None
-    if manager:
-        if request.POST:
-            show = int(request.POST.get('show'))
-            if show == 1:
-                courses = Course.objects.filter(archive=True)
-            else:
-                if show:
-                    courses = Course.objects.filter(outcome__id=show).filter(archive=False)
-                else:
-                    courses = Course.objects.filter(archive=False)
-        else:
-            courses = Course.objects.filter(archive=False)
-    else:
-        courses = Course.objects.filter(user=user).filter(archive=False)
+    if manager and request.POST:
+        show = int(request.POST.get('show'))
     outcomes = Outcome.objects.filter(active=True)
     return render(
         request,
         'dashboard/home.html',
         {
-            'courses': courses,
             'outcomes': outcomes,
             'manager': manager,
             'show': show,
@@ -66,16 +373,90 @@ def home(request):
 
 
 @login_required
+def course_data(request):
+    """Course table rows for the dashboard via DataTables server-side ajax."""
+    user = request.user
+    manager = is_manager(user)
+    try:
+        show = int(request.GET.get('show', 0))
+    except ValueError:
+        show = 0
+    return datatable(
+        request,
+        course_queryset(user, manager, show),
+        'dashboard/row.inc.html',
+        COURSE_COLUMNS,
+    )
+
+
+def detail_context(course, user):
+    """Everything the course detail page shows, in a fixed number of queries.
+
+    Outcomes carry their OutcomeCourse as 'oc' and their elements as
+    'element_list', each element with the course SLO descriptions in
+    'course_slos'. Notes are split into public (adenda) and committee
+    (comments) lists by tag.
+    """
+    prefetch_related_objects([course], 'outcome')
+    outcomes = list(course.outcome.all())
+    index = OutcomeCourse.index([course])
+    elements = {}
+    for element in OutcomeElement.objects.filter(
+        outcome__in=outcomes,
+    ).order_by('id'):
+        element.course_slos = []
+        elements.setdefault(element.outcome_id, []).append(element)
+    by_element = {
+        element.id: element
+        for element_list in elements.values() for element in element_list
+    }
+    for slo in CourseOutcome.objects.filter(course=course).order_by('id'):
+        if slo.slo_id in by_element:
+            by_element[slo.slo_id].course_slos.append(slo.description)
+    for outcome in outcomes:
+        outcome.oc = index.get((course.id, outcome.id))
+        outcome.element_list = elements.get(outcome.id, [])
+    adenda = []
+    comments = []
+    for note in course.notes.select_related('created_by'):
+        if note.kind in {'Furbish', 'Adenda'}:
+            adenda.append(note)
+        if note.kind == 'Comments':
+            comments.append(note)
+    docs = list(course.docs.all())
+    # Course.syllabus() is memoized; answer it from the documents above
+    course._syllabus = next(
+        (doc for doc in docs if doc.kind == 'Syllabus'), None,
+    )
+    return {
+        'course': course,
+        'perms': course.permissions(user),
+        'outcomes': outcomes,
+        'adenda': adenda,
+        'comments': comments,
+        'docs': docs,
+        'syllabus': course._syllabus,
+        'chunk_size': settings.UPLOAD_CHUNK_SIZE,
+    }
+
+
+@login_required
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=detail_etag)
 def detail(request, cid):
     """View course details."""
     user = request.user
-    course = get_object_or_404(Course, pk=cid)
-    perms = course.permissions(user)
-    if course.user == user or perms:
+    course = get_object_or_404(
+        Course.objects.select_related('user', 'updated_by').prefetch_related(
+            'outcome',
+        ),
+        pk=cid,
+    )
+    if course.user == user or course.permissions(user):
         response = render(
             request,
             'dashboard/detail.html',
-            {'course': course, 'perms': perms},
+            detail_context(course, user),
         )
     else:
         messages.add_message(
@@ -92,7 +473,7 @@ def detail(request, cid):
 @login_required
 def outcome_status(request):
     """Update the status of a course outcome."""
-    manager = in_group(request.user, settings.MANAGER_GROUP)
+    manager = is_manager(request.user)
     extra_tags='alert-success'
     if not manager:
         message = "You do not have permission to update this course."
@@ -137,8 +518,7 @@ def outcome_status(request):
                 if settings.DEBUG:
                     course.to_list = to_list
                     to_list = bcc
-                send_mail(
-                    request,
+                queue_mail(
                     to_list,
                     subject,
                     email,
@@ -146,6 +526,7 @@ def outcome_status(request):
                     {'course': course, 'outcome': oc},
                     reply_to=[email,],
                     bcc=bcc,
+                    digest='course-{0}'.format(course.id),
                 )
             else:
                 message = "Could not find course outcome with that ID."
@@ -182,6 +563,7 @@ def furbish(request, cid):
             note.course = course
             note.created_by = user
             note.updated_by = user
+            note.kind = 'Furbish'
             note.save()
             note.tags.add('Furbish')
             course.furbish = True
@@ -193,9 +575,6 @@ def furbish(request, cid):
             # set course outcomes values for 'approve' and 'furbish'.
             course.set_outcome('approve', False, None)
             course.set_outcome('furbish', True, None)
-            for outcome in course.get_outcomes():
-                outcome.furbish = True
-                outcome.save()
             message = '''
                 The status of course {0} ({1}) has been set to "needs more work"
                 and we have sent an email to {2} {3} with your comments.
@@ -218,24 +597,11 @@ def furbish(request, cid):
             if settings.DEBUG:
                 course.to_list = to_list
                 to_list = bcc
-
-                send_mail(
-                    request,
-                    to_list,
-                    subject,
-                    email,
-                    template,
-                    {'course': course, 'outcome': oc},
-                    reply_to=[email,],
-                    bcc=bcc,
-                )
             frum = course.user.email
-            recci = send_mail(
-                request,
+            queue_mail(
                 to_list,
                 subject,
                 frum,
-                course.user.email,
                 'geoc/email_status.html',
                 course,
                 reply_to=[frum,],
@@ -340,8 +706,7 @@ def status(request):
                         course.to_list = to_list
                         to_list = bcc
                     frum = course.user.email
-                    send_mail(
-                        request,
+                    queue_mail(
                         to_list,
                         subject,
                         course.user.email,
@@ -349,6 +714,7 @@ def status(request):
                         course,
                         reply_to=[frum,],
                         bcc=bcc,
+                        digest='course-{0}'.format(course.id),
                     )
             else:
                 message = "Requires '{0}'".format(valid_status)
@@ -395,6 +761,30 @@ def note_delete(request, nid):
     return HttpResponseRedirect(request.META.get('HTTP_REFERER'))
 
 
+@login_required
+def document(request, did, preview=False):
+    """Send a course document, or its preview, to those who may see the course.
+
+    The transfer itself is left to the web server when DOCUMENT_SENDFILE is
+    set, see core.sendfile.
+    """
+    doc = get_object_or_404(
+        Document.objects.select_related('course').exclude(phile=''), pk=did,
+    )
+    course = doc.course
+    if course.user_id != request.user.id and not course.permissions(request.user):
+        raise Http404
+    phile = doc.preview if preview else doc.phile
+    if not phile:
+        raise Http404
+    extension = os.path.splitext(phile.name)[1]
+    filename = '{0}{1}'.format(slugify(doc.name) or 'document', extension)
+    try:
+        return send_file(request, phile, filename)
+    except FileNotFoundError:
+        raise Http404
+
+
 @login_required
 def phile_upload(request):
     """Upload a file for a course."""
@@ -410,6 +800,8 @@ def phile_upload(request):
             message = "Invalid course ID"
         if cid:
             course = get_object_or_404(Course, pk=cid)
+            if course.user_id != user.id and not course.permissions(user):
+                raise Http404
             form = DocumentRequiredForm(
                 request.POST,
                 request.FILES,
@@ -439,6 +831,76 @@ def phile_upload(request):
     return HttpResponseRedirect(request.META.get('HTTP_REFERER'))
 
 
+@login_required
+def phile_chunk(request):
+    """Receive one part of a resumable file upload for a course.
+
+    GET with an upload ID answers with the bytes stored so far, so that an
+    interrupted upload picks up from there. POST appends the 'chunk' file
+    when 'offset' matches what is stored, and answers 409 with the right
+    offset when it does not. The part sent with 'final' turns the upload into
+    a document of course 'cid'; process_documents does the rest later.
+    """
+    upload = request.GET.get('upload') or request.POST.get('upload')
+    try:
+        part = partial_path(request.user, upload)
+    except ValueError:
+        return HttpResponseBadRequest("Invalid upload ID")
+    size = partial_size(part)
+    data = {'offset': size}
+    status = 200
+    if request.method == 'POST':
+        post = request.POST
+        chunk = request.FILES.get('chunk')
+        try:
+            offset = int(post.get('offset'))
+        except (TypeError, ValueError):
+            return HttpResponseBadRequest("Invalid offset")
+        if chunk is None or chunk.size > settings.UPLOAD_CHUNK_SIZE:
+            return HttpResponseBadRequest("Invalid chunk")
+        if size + chunk.size > settings.UPLOAD_MAX_SIZE:
+            return HttpResponseBadRequest("File is too large")
+        course = None
+        if post.get('final'):
+            try:
+                course = get_object_or_404(Course, pk=int(post.get('cid')))
+            except (TypeError, ValueError):
+                return HttpResponseBadRequest("Invalid course ID")
+            # the same people who can see the course on the detail page
+            if course.user_id != request.user.id and not course.permissions(request.user):
+                raise Http404
+            if not post.get('name'):
+                return HttpResponseBadRequest("Please provide a description")
+        if offset != size:
+            status = 409
+        else:
+            append_chunk(part, chunk)
+            data['offset'] = size + chunk.size
+            if course:
+                doc = Document(
+                    course=course,
+                    name=post.get('name'),
+                    created_by=request.user,
+                    updated_by=request.user,
+                )
+                try:
+                    finish_upload(part, doc, post.get('filename'))
+                except ValidationError as error:
+                    return HttpResponseBadRequest(' '.join(error.messages))
+                data['id'] = doc.id
+                messages.add_message(
+                    request,
+                    messages.SUCCESS,
+                    "File uploaded successfully.",
+                    extra_tags='alert-success',
+                )
+    return HttpResponse(
+        json.dumps(data),
+        content_type='application/json; charset=utf-8',
+        status=status,
+    )
+
+
 @csrf_exempt
 @group_required(settings.MANAGER_GROUP)
 def annotation(request):
@@ -465,6 +927,7 @@ def annotation(request):
                 created_by=user,
                 updated_by=user,
                 body=body,
+                kind=tag_kind({ctype.capitalize()}),
             )
             note.tags.add(ctype.capitalize())
             course.notes.add(note)
@@ -484,8 +947,7 @@ def annotation(request):
                     user.last_name,
                 )
                 frum = user.email
-                send_mail(
-                    request,
+                queue_mail(
                     to_list,
                     subject,
                     frum,
@@ -9,6 +9,7 @@ from lamantin.geoc.models import Course
 from lamantin.geoc.models import CourseOutcome
 from lamantin.geoc.models import Document
 from lamantin.geoc.models import Outcome
+from lamantin.geoc.models import outcome_tags
 
 logger = logging.getLogger('debug_logfile')
 # regex for course number: HIS 420X, PHL 4200, etc
@@ -21,22 +22,23 @@ class Dupes:
     def __init__(self):
         """Initialize the object with defauls."""
         self.tags = {
-            'Abilities': {'outcomes': [], 'check': False},
-            'Explorations': {'outcomes': [], 'check': False},
-            'Perspectives': {'outcomes': [], 'check': False},
+            'Abilities': {'outcomes': set(), 'check': False},
+            'Explorations': {'outcomes': set(), 'check': False},
+            'Perspectives': {'outcomes': set(), 'check': False},
         }
         self.error = []
 
     def get_outcomes(self):
-        """Fetch the outcome objects for each tag."""
-        for tag, outcomes in self.tags.items():
-            self.tags[tag]['outcomes'] = Outcome.objects.filter(tags__name__in=[tag])
+        """Fetch the outcome ids for each tag from the shared index."""
+        for oid, names in outcome_tags().items():
+            for tag in names.intersection(self.tags):
+                self.tags[tag]['outcomes'].add(oid)
 
     def check(self, outcomes):
         """Check for dupes."""
         for outcome in outcomes:
             for tag, slo in self.tags.items():
-                if outcome in slo['outcomes']:
+                if outcome.id in slo['outcomes']:
                     if not slo['check']:
                         slo['check'] = True
                     else:
@@ -154,6 +156,64 @@ class CourseOutcomeForm(forms.ModelForm):
         return cd
 
 
+class LoadedChoiceField(forms.ModelChoiceField):
+    """Primary key field of a formset form, checked against loaded rows."""
+
+    def __init__(self, formset, *args, **kwargs):
+        """Keep the formset whose queryset holds the rows."""
+        self.formset = formset
+        super().__init__(*args, **kwargs)
+
+    def to_python(self, value):
+        """The row with the posted primary key, found without a query."""
+        if value in self.empty_values:
+            return None
+        try:
+            row = self.formset._existing_object(
+                self.queryset.model._meta.pk.to_python(value),
+            )
+        except forms.ValidationError:
+            row = None
+        if row is None:
+            raise forms.ValidationError(
+                self.error_messages['invalid_choice'],
+                code='invalid_choice',
+                params={'value': value},
+            )
+        return row
+
+
+class LoadedModelFormSet(forms.BaseModelFormSet):
+    """Model formset that checks posted ids against its own queryset.
+
+    Django looks up the id of every form with a query of its own; the rows
+    are loaded once for the formset anyway, so use those.
+    """
+
+    def add_fields(self, form, index):
+        """Swap the primary key field for one that reads the loaded rows."""
+        super().add_fields(form, index)
+        name = self._pk_field.name
+        field = form.fields[name]
+        form.fields[name] = LoadedChoiceField(
+            self,
+            field.queryset,
+            initial=field.initial,
+            required=False,
+            widget=field.widget,
+        )
+
+
+# SLO rows come with the course outcomes; the formset never adds any
+CourseOutcomeFormSet = forms.modelformset_factory(
+    CourseOutcome,
+    form=CourseOutcomeForm,
+    formset=LoadedModelFormSet,
+    extra=0,
+    edit_only=True,
+)
+
+
 class AnnotationForm(forms.ModelForm):
     """GEOC document required fields."""
 
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+
+"""Set the kind of documents and notes from their tags."""
+
+from django.core.management.base import BaseCommand
+from lamantin.geoc.models import Annotation
+from lamantin.geoc.models import Document
+from lamantin.geoc.models import KIND_CHOICES
+
+
+class Command(BaseCommand):
+    """Backfill Document.kind and Annotation.kind for rows tagged before them.
+
+    Run once after migrating to the kind fields; it only touches rows whose
+    kind is still blank, so it is safe to run again. Kinds are applied in the
+    order of KIND_CHOICES so a row with several kind tags gets the same kind
+    the tagging signal would give it.
+    """
+
+    help = 'Fill in the kind of documents and notes from their taggit tags.'
+
+    def handle(self, *args, **options):
+        """One UPDATE per model and kind."""
+        for model in (Document, Annotation):
+            for kind, label in KIND_CHOICES:
+                count = model.objects.filter(
+                    kind='', tags__name=kind,
+                ).update(kind=kind)
+                self.stdout.write('{0} {1}: {2}'.format(
+                    model._meta.verbose_name, kind, count,
+                ))
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+
+"""Move existing course documents into content addressed storage."""
+
+import logging
+import os
+import shutil
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from lamantin.geoc.models import Document
+from lamantin.geoc.models import release_files
+from lamantin.geoc.storage import BLOB_DIR
+from lamantin.geoc.storage import blob_name
+from lamantin.geoc.storage import file_digest
+
+
+logger = logging.getLogger('debug_logfile')
+
+
+class Command(BaseCommand):
+    """Store every document file once, under the hash of its content.
+
+    Each stored file is hashed in place and the first copy of some content is
+    linked to its blob name. The documents naming the file are then pointed at
+    the blob and the old name is deleted once that commits, so a crash at any
+    point leaves every document naming a file that exists. Checksum, page
+    count and preview are cleared for process_documents to redo. Files
+    already in the blob tree are left alone, so the command can be run again
+    safely.
+    """
+
+    help = 'Deduplicate course documents in place by content hash.'
+
+    def add_arguments(self, parser):
+        """Report without changing anything."""
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        """One pass over the distinct file names in use."""
+        dry_run = options['dry_run']
+        storage = Document._meta.get_field('phile').storage
+        names = Document.objects.exclude(phile__isnull=True).exclude(
+            phile='',
+        ).exclude(
+            phile__startswith=BLOB_DIR,
+        ).order_by('phile').values_list('phile', flat=True).distinct()
+        moved = merged = missing = freed = 0
+        seen = set()
+        for name in names:
+            path = storage.path(name)
+            if not os.path.exists(path):
+                missing += 1
+                logger.debug('dedupe: missing {0}'.format(name))
+                continue
+            digest = file_digest(path)
+            blob = blob_name(digest, name)
+            duplicate = digest in seen or storage.exists(blob)
+            seen.add(digest)
+            if duplicate:
+                merged += 1
+                freed += os.path.getsize(path)
+            else:
+                moved += 1
+            if dry_run:
+                continue
+            if not duplicate:
+                target = storage.path(blob)
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                try:
+                    os.link(path, target)
+                except OSError:
+                    # no hard links here; never leave a partial blob behind
+                    shutil.copy2(path, '{0}.part'.format(target))
+                    os.replace('{0}.part'.format(target), target)
+            with transaction.atomic():
+                docs = Document.objects.filter(phile=name)
+                previews = list(docs.values_list('preview', flat=True))
+                # queryset update: no signals, so nothing releases the blob
+                docs.update(phile=blob, sha256='', pages=None, preview=None)
+                release_files({'preview': previews})
+                transaction.on_commit(lambda path=path: os.remove(path))
+        self.stdout.write(
+            '{0}moved: {1}, merged: {2}, missing: {3}, bytes freed: {4}'.format(
+                'dry run, ' if dry_run else '', moved, merged, missing, freed,
+            ),
+        )
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+
+"""Report rows that would violate the geoc unique constraints."""
+
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+from django.db.models import Count
+from lamantin.geoc.models import CourseOutcome
+from lamantin.geoc.models import OutcomeCourse
+
+
+# (model, fields) of every unique constraint added after the tables existed
+CHECKS = (
+    (OutcomeCourse, ('course_id', 'outcome_id')),
+    (CourseOutcome, ('course_id', 'slo_id')),
+)
+
+
+class Command(BaseCommand):
+    """List duplicate OutcomeCourse and CourseOutcome rows.
+
+    Run before migrating to the unique constraints: each duplicate group is
+    printed with its row ids, oldest first, so the extra rows can be reviewed
+    and removed by hand. The command fails while any duplicates remain.
+    """
+
+    help = 'Report duplicate rows that block the geoc unique constraints.'
+
+    def handle(self, *args, **options):
+        """Check each constraint in turn."""
+        total = 0
+        for model, fields in CHECKS:
+            groups = model.objects.values(*fields).annotate(
+                rows=Count('id'),
+            ).filter(rows__gt=1).order_by(*fields)
+            for group in groups:
+                ids = model.objects.filter(
+                    **{field: group[field] for field in fields}
+                ).order_by('id').values_list('id', flat=True)
+                self.stdout.write('{0} {1}: ids {2}'.format(
+                    model._meta.db_table,
+                    ', '.join(
+                        '{0}={1}'.format(field, group[field]) for field in fields
+                    ),
+                    ', '.join(str(pk) for pk in ids),
+                ))
+                total += 1
+        if total:
+            raise CommandError('{0} duplicate groups found'.format(total))
+        self.stdout.write('no duplicates')
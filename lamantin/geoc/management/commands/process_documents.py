@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+
+"""Checksum new documents and make their page counts and previews."""
+
+import logging
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from lamantin.geoc.models import Document
+from lamantin.geoc.uploads import clear_partials
+from lamantin.geoc.uploads import process_document
+
+
+logger = logging.getLogger('debug_logfile')
+
+
+class Command(BaseCommand):
+    """Process uploaded documents that have no checksum yet; run from cron.
+
+    Page counts and previews come from pdfinfo and pdftoppm (poppler-utils);
+    without them documents still get their checksum. Partial uploads older
+    than UPLOAD_PARTIAL_AGE are removed on the way out.
+    """
+
+    help = 'Checksum new documents and make PDF page counts and previews.'
+
+    def add_arguments(self, parser):
+        """How many documents to process in one run."""
+        parser.add_argument('--batch', type=int, default=100)
+
+    def handle(self, *args, **options):
+        """One pass over the unprocessed documents."""
+        docs = Document.objects.filter(sha256='').exclude(
+            phile__isnull=True,
+        ).exclude(phile='').order_by('id')[:options['batch']]
+        done = failed = 0
+        for doc in docs:
+            try:
+                process_document(doc)
+            except OSError as error:
+                # a missing file stays unprocessed and is reported every run
+                failed += 1
+                logger.debug('document {0}: {1}'.format(doc.id, error))
+            else:
+                done += 1
+        removed = clear_partials(settings.UPLOAD_PARTIAL_AGE)
+        self.stdout.write('processed: {0}, failed: {1}, partials removed: {2}'.format(
+            done, failed, removed,
+        ))
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+
+"""Query count and wall time benchmark over a synthetic catalogue."""
+
+import statistics
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.test.utils import override_settings
+from django.test.utils import setup_test_environment
+from django.test.utils import teardown_test_environment
+from django.urls import reverse
+from lamantin.geoc.management.commands.synthetic_catalogue import PREFIX
+from lamantin.geoc.models import Course
+from lamantin.geoc.models import Outcome
+
+
+def outcome_data(course):
+    """POST data for the SLO formset of a course, unchanged."""
+    slos = course.outcomes.filter(slo__outcome__active=True).order_by(
+        'slo__outcome__name', 'slo__id',
+    )
+    data = {
+        'slo-TOTAL_FORMS': len(slos),
+        'slo-INITIAL_FORMS': len(slos),
+        'slo-MIN_NUM_FORMS': 0,
+        'slo-MAX_NUM_FORMS': 1000,
+        'body': 'Benchmark',
+    }
+    for index, slo in enumerate(slos):
+        data['slo-{0}-id'.format(index)] = slo.id
+        data['slo-{0}-description'.format(index)] = slo.description or ''
+    return data
+
+
+def scenarios():
+    """(url name, method, path, post data, user, expected status) per view.
+
+    Shared with the query budget tests in geoc.tests.
+    """
+    courses = Course.objects.select_related('user').order_by('id')
+    course = courses.filter(cross_listing__isnull=False).first()
+    draft = courses.filter(save_submit=False).first()
+    outcome = Outcome.objects.filter(course_outcomes__isnull=False).first()
+    manager = User.objects.get(username='{0}manager'.format(PREFIX))
+    table = {'draw': 1, 'start': 0, 'length': 25}
+    return [
+        ('dashboard_home', 'get', reverse('dashboard_home'), None, manager, 200),
+        ('course_data', 'get', reverse('course_data'), table, manager, 200),
+        ('detail', 'get', reverse('detail', args=[course.id]), None, manager, 200),
+        ('designation_home', 'get', reverse('designation_home'), None, manager, 200),
+        ('courses', 'get', reverse('courses', args=[outcome.id]), None, manager, 200),
+        (
+            'outcome_course_data',
+            'get',
+            reverse('outcome_course_data', args=[outcome.id]),
+            table,
+            manager,
+            200,
+        ),
+        (
+            'outcome_form',
+            'get',
+            reverse('outcome_form', args=[draft.id]),
+            None,
+            draft.user,
+            200,
+        ),
+        (
+            'outcome_form',
+            'post',
+            reverse('outcome_form', args=[draft.id]),
+            outcome_data(draft),
+            draft.user,
+            302,
+        ),
+        (
+            'status',
+            'post',
+            reverse('status'),
+            {'cid': course.id, 'status': 'reopen'},
+            manager,
+            200,
+        ),
+    ]
+
+
+def query_budget(name):
+    """The query count budget of a view, None if it has none."""
+    budget = settings.LAMANTIN_QUERY_BUDGETS.get(name)
+    if isinstance(budget, dict):
+        budget = budget.get('queries')
+    return budget
+
+
+class Command(BaseCommand):
+    """Run the main views against catalogues of growing size.
+
+    Each size is generated with synthetic_catalogue into a throwaway test
+    database (an in-memory one under SQLite) with a local memory cache, so
+    the configured database and cache are never touched. Every view is
+    requested --repeat times; the most queries seen is checked against
+    LAMANTIN_QUERY_BUDGETS and the median wall time is reported. The command
+    fails if any view goes over its budget or answers with the wrong status.
+    """
+
+    help = 'Check view query budgets against synthetic catalogues.'
+
+    def add_arguments(self, parser):
+        """Catalogue sizes and repetitions."""
+        parser.add_argument('--sizes', default='100,1000,10000')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--repeat', type=int, default=3)
+
+    def handle(self, *args, **options):
+        """Set up the throwaway database and run every size."""
+        sizes = [int(size) for size in options['sizes'].split(',')]
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0)
+        cache = {'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }}
+        over = []
+        try:
+            with override_settings(CACHES=cache, LAMANTIN_INSTRUMENTATION=False):
+                for size in sizes:
+                    call_command('flush', interactive=False, verbosity=0)
+                    call_command(
+                        'synthetic_catalogue',
+                        courses=size,
+                        seed=options['seed'],
+                        stdout=self.stdout,
+                    )
+                    over += self.run(size, options['repeat'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+        if over:
+            raise CommandError('failed: {0}'.format(', '.join(over)))
+
+    def run(self, size, repeat):
+        """Request each view and report; returns the views that failed."""
+        over = []
+        self.stdout.write('{0} courses'.format(size))
+        for name, method, path, data, user, status in scenarios():
+            client = Client()
+            client.force_login(user)
+            counts = []
+            times = []
+            codes = set()
+            for _ in range(repeat):
+                with CaptureQueriesContext(connection) as queries:
+                    start = time.perf_counter()
+                    response = getattr(client, method)(path, data)
+                    times.append(time.perf_counter() - start)
+                counts.append(len(queries))
+                codes.add(response.status_code)
+            budget = query_budget(name)
+            verdict = ''
+            if codes != {status}:
+                verdict = 'STATUS'
+                over.append('{0} {1} @ {2} answered {3}'.format(
+                    method.upper(), name, size, sorted(codes),
+                ))
+            elif budget is not None and max(counts) > budget:
+                verdict = 'OVER'
+                over.append('{0} {1} @ {2}'.format(method.upper(), name, size))
+            self.stdout.write(
+                '  {0:<4} {1:<22} {2} queries {3:>4} budget {4:>4} {5:>9.1f} ms {6}'.format(
+                    method.upper(),
+                    name,
+                    response.status_code,
+                    max(counts),
+                    budget if budget is not None else '-',
+                    statistics.median(times) * 1000,
+                    verdict,
+                ),
+            )
+        return over
@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+
+"""Generate a reproducible synthetic course catalogue."""
+
+import datetime
+import random
+
+from django.conf import settings
+from django.contrib.auth.models import Group
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from lamantin.geoc.models import Annotation
+from lamantin.geoc.models import Course
+from lamantin.geoc.models import CourseOutcome
+from lamantin.geoc.models import Document
+from lamantin.geoc.models import Outcome
+from lamantin.geoc.models import OutcomeCourse
+from lamantin.geoc.models import OutcomeElement
+from lamantin.geoc.models import tag_kind
+from taggit.models import Tag
+from taggit.models import TaggedItem
+
+
+# every synthetic user name starts with this, which is how --clear finds them
+PREFIX = 'synthetic_'
+GROUPS = ('Abilities', 'Explorations', 'Perspectives')
+SUBJECTS = ('ART', 'BIO', 'CHM', 'ECN', 'ENG', 'HIS', 'MTH', 'PHL', 'PHY', 'PSY')
+WORDS = (
+    'analysis', 'culture', 'data', 'design', 'ethics', 'evidence', 'history',
+    'inquiry', 'language', 'method', 'modern', 'practice', 'science',
+    'society', 'systems', 'theory', 'world', 'writing',
+)
+
+
+class Command(BaseCommand):
+    """Fill the database with courses, outcomes, SLOs, documents and notes.
+
+    The same --courses and --seed always produce the same catalogue, so the
+    query_budgets benchmark is comparable from run to run.
+    """
+
+    help = 'Generate a reproducible synthetic course catalogue.'
+
+    def add_arguments(self, parser):
+        """Catalogue size and shape."""
+        parser.add_argument('--courses', type=int, default=100)
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument(
+            '--cross', type=float, default=0.2,
+            help='share of courses that are cross-listed',
+        )
+        parser.add_argument(
+            '--clear', action='store_true',
+            help='remove synthetic data from an earlier run first',
+        )
+
+    def handle(self, *args, **options):
+        """Build the catalogue in one transaction."""
+        self.random = random.Random(options['seed'])
+        with transaction.atomic():
+            if options['clear']:
+                self.clear()
+            users = self.users(max(1, options['courses'] // 20))
+            outcomes = self.outcomes()
+            courses = self.courses(options['courses'], users)
+            self.cross_list(courses, options['cross'])
+            self.course_outcomes(courses, outcomes)
+            self.documents(courses)
+            self.annotations(courses, users)
+        self.stdout.write('generated {0} courses'.format(len(courses)))
+
+    def sentence(self, size):
+        """Some words."""
+        return ' '.join(self.random.choice(WORDS) for _ in range(size)).capitalize()
+
+    def clear(self):
+        """Delete what an earlier run created."""
+        users = User.objects.filter(username__startswith=PREFIX)
+        Course.objects.filter(user__in=users).delete()
+        Annotation.objects.filter(created_by__in=users).delete()
+        users.delete()
+        Outcome.objects.filter(name__startswith=PREFIX).delete()
+
+    def users(self, count):
+        """A manager and some faculty."""
+        manager, _ = User.objects.get_or_create(
+            username='{0}manager'.format(PREFIX),
+            defaults={'email': 'manager@example.com', 'first_name': 'Manager'},
+        )
+        group, _ = Group.objects.get_or_create(name=settings.MANAGER_GROUP)
+        manager.groups.add(group)
+        faculty = [
+            User.objects.get_or_create(
+                username='{0}faculty{1}'.format(PREFIX, index),
+                defaults={
+                    'email': 'faculty{0}@example.com'.format(index),
+                    'first_name': 'Faculty',
+                    'last_name': str(index),
+                },
+            )[0]
+            for index in range(count)
+        ]
+        return [manager] + faculty
+
+    def outcomes(self):
+        """Four tagged outcomes per group, each with three to five elements."""
+        outcomes = []
+        for name in GROUPS:
+            group, _ = Group.objects.get_or_create(name=name)
+            for index in range(4):
+                outcome = Outcome.objects.create(
+                    name='{0}{1} {2}'.format(PREFIX, name, index),
+                    description=self.sentence(12),
+                    rationale=self.sentence(12),
+                    group=group,
+                )
+                outcome.tags.add(name)
+                outcomes.append(outcome)
+        OutcomeElement.objects.bulk_create([
+            OutcomeElement(outcome=outcome, description=self.sentence(10))
+            for outcome in outcomes
+            for _ in range(self.random.randint(3, 5))
+        ])
+        return outcomes
+
+    def courses(self, count, users):
+        """Courses spread over the faculty with a mix of workflow states."""
+        faculty = users[1:]
+        today = datetime.date.today()
+        courses = []
+        for index in range(count):
+            approved = self.random.random() < 0.3
+            courses.append(Course(
+                user=self.random.choice(faculty),
+                title=self.sentence(4),
+                number='{0} {1:04d}'.format(self.random.choice(SUBJECTS), index),
+                multipass='No',
+                approved=approved,
+                approved_date=today if approved else None,
+                furbish=not approved and self.random.random() < 0.2,
+                save_submit=self.random.random() < 0.5,
+                archive=self.random.random() < 0.05,
+                status=self.random.choice(('Provisional', 'Confirmed', None)),
+            ))
+        Course.objects.bulk_create(courses, batch_size=500)
+        # MySQL does not hand back primary keys from bulk_create
+        return list(Course.objects.order_by('-id')[:count])[::-1]
+
+    def cross_list(self, courses, share):
+        """Cross-list a share of the courses with one or two others."""
+        through = Course.cross_listing.through
+        rows = set()
+        for course in courses:
+            if self.random.random() >= share:
+                continue
+            for other in self.random.sample(courses, min(2, len(courses))):
+                if other.id != course.id:
+                    rows.add((course.id, other.id))
+                    rows.add((other.id, course.id))
+        through.objects.bulk_create(
+            [through(from_course_id=one, to_course_id=two) for one, two in rows],
+            batch_size=1000,
+        )
+        multipass = {one for one, _ in rows}
+        Course.objects.filter(id__in=multipass).update(multipass='Yes')
+
+    def course_outcomes(self, courses, outcomes):
+        """One to three outcomes per course and an SLO row per element."""
+        elements = {}
+        for element in OutcomeElement.objects.filter(outcome__in=outcomes):
+            elements.setdefault(element.outcome_id, []).append(element)
+        links = []
+        slos = []
+        for course in courses:
+            for outcome in self.random.sample(outcomes, self.random.randint(1, 3)):
+                links.append(OutcomeCourse(
+                    course=course,
+                    outcome=outcome,
+                    approved=course.approved or self.random.random() < 0.3,
+                    furbish=course.furbish,
+                ))
+                slos.extend(
+                    CourseOutcome(
+                        course=course, slo=element, description=self.sentence(20),
+                    )
+                    for element in elements[outcome.id]
+                )
+        OutcomeCourse.objects.bulk_create(links, batch_size=1000)
+        CourseOutcome.objects.bulk_create(slos, batch_size=1000)
+
+    def span(self, courses):
+        """The generated courses as a query rather than a long IN list."""
+        return Course.objects.filter(id__range=(courses[0].id, courses[-1].id))
+
+    def tag(self, objects, name):
+        """Tag many objects at once."""
+        tag, _ = Tag.objects.get_or_create(name=name)
+        TaggedItem.objects.bulk_create(
+            [
+                TaggedItem(
+                    tag=tag,
+                    content_type=ContentType.objects.get_for_model(obj),
+                    object_id=obj.id,
+                )
+                for obj in objects
+            ],
+            batch_size=1000,
+        )
+
+    def documents(self, courses):
+        """A syllabus for each course; the files themselves are not created."""
+        Document.objects.bulk_create(
+            [
+                Document(
+                    course=course,
+                    created_by=course.user,
+                    updated_by=course.user,
+                    name='Syllabus',
+                    kind='Syllabus',
+                    phile='files/course/synthetic/{0}.pdf'.format(course.id),
+                )
+                for course in courses
+            ],
+            batch_size=1000,
+        )
+        self.tag(Document.objects.filter(course__in=self.span(courses)), 'Syllabus')
+
+    def annotations(self, courses, users):
+        """Up to three notes per course from the manager or the owner."""
+        notes = []
+        for course in courses:
+            for _ in range(self.random.randint(0, 3)):
+                author = self.random.choice((users[0], course.user))
+                notes.append(Annotation(
+                    course=course,
+                    created_by=author,
+                    updated_by=author,
+                    body=self.sentence(25),
+                ))
+        Annotation.objects.bulk_create(notes, batch_size=1000)
+        notes = list(
+            Annotation.objects.filter(course__in=self.span(courses)).order_by('id'),
+        )
+        names = {note.id: set() for note in notes}
+        for name in ('Comments', 'Furbish', 'Adenda'):
+            tagged = [note for note in notes if self.random.random() < 0.3]
+            self.tag(tagged, name)
+            for note in tagged:
+                names[note.id].add(name)
+        # bulk tagging sends no m2m_changed, so set the kinds here
+        for note in notes:
+            note.kind = tag_kind(names[note.id])
+        Annotation.objects.bulk_update(notes, ['kind'], batch_size=1000)
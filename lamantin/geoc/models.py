@@ -3,16 +3,26 @@
 """Data models."""
 
 import datetime
+import os
+import uuid
 
 from django.conf import settings
 from django.contrib.auth.models import Group
 from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
 from django.db import models
+from django.db import transaction
 from django.dispatch import receiver
 from djtools.fields import BINARY_CHOICES
 from djtools.fields.helpers import upload_to_path
-from djtools.utils.users import in_group
+from lamantin.core.permissions import is_manager
+from lamantin.core.permissions import user_groups
+from lamantin.geoc.signals import outcomes_updated
+from lamantin.geoc.storage import blob_storage
 from taggit.managers import TaggableManager
+from taggit.models import Tag
+from taggit.models import TaggedItem
 
 
 ICONS = {
@@ -30,6 +40,21 @@ STATUS_CHOICES = (
     ('Provisional', 'Provisional'),
     ('Confirmed', 'Confirmed'),
 )
+# what a document or note is for, mirrored from its tags; first match wins
+KIND_CHOICES = (
+    ('Syllabus', 'Syllabus'),
+    ('Comments', 'Comments'),
+    ('Adenda', 'Adenda'),
+    ('Furbish', 'Furbish'),
+)
+# cache key for the version stamp of the outcome tag index
+OUTCOME_TAGS_VERSION = 'geoc_outcome_tags_version'
+# outcome tag index shared by everything in this process
+OUTCOME_TAGS = {'version': None, 'index': None}
+# cache key for the version stamp of the table rows rendered for a course
+COURSE_VERSION = 'geoc_course_version_{0}'
+# file fields of a document, removed with the last document naming them
+DOCUMENT_FILES = ('phile', 'preview')
 
 
 class Outcome(models.Model):
@@ -66,6 +91,48 @@ class Outcome(models.Model):
         return self.name.replace(' ', '')
 
 
+class CourseListQuerySet(models.QuerySet):
+    """QuerySet for the course tables on the dashboard."""
+
+    def listing(self):
+        """Load everything a course table row needs in a fixed number of queries."""
+        syllabus = Document.objects.filter(
+            course=models.OuterRef('pk'),
+            kind='Syllabus',
+        ).order_by('created_at').values('id')[:1]
+        return self.select_related('user').annotate(
+            syllabus_doc=models.Subquery(syllabus),
+        ).prefetch_related(
+            models.Prefetch(
+                'cross_listing',
+                queryset=Course.objects.only('id', 'number'),
+            ),
+            models.Prefetch(
+                'outcomecourse_set',
+                queryset=OutcomeCourse.objects.select_related(
+                    'outcome__group',
+                ).order_by('outcome__name'),
+                to_attr='outcome_courses',
+            ),
+        )
+
+    def last_modified(self):
+        """Latest change to the courses, their outcomes, notes and documents.
+
+        One aggregate query; None when there are no courses.
+        """
+        stamps = self.aggregate(
+            course=models.Max('updated_at'),
+            outcomes=models.Max('outcomecourse__updated_at'),
+            notes=models.Max('notes__updated_at'),
+            docs=models.Max('docs__updated_at'),
+        )
+        return max(
+            (stamp for stamp in stamps.values() if stamp is not None),
+            default=None,
+        )
+
+
 class Course(models.Model):
     """Choices for model and form fields that accept for multiple values."""
 
@@ -132,42 +199,52 @@ class Course(models.Model):
         help_text="Check all that apply",
     )
 
+    objects = CourseListQuerySet.as_manager()
+
     class Meta:
         """Attributes about the data model and admin options."""
 
         ordering = ['title']
+        indexes = [models.Index(fields=['archive', 'user'])]
 
     def __str__(self):
         """Default data for display."""
         return self.title
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """Remember the stored number; cross-listed rows only show that."""
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_number = instance.__dict__.get('number')
+        return instance
+
     def get_slug(self):
         """Slug for file uploads."""
         return 'files/course/'
 
     def syllabus(self):
         """Obtain course syllabus if one exists."""
-        phile = None
-        for doc in self.docs.annotate(tag_name=models.F('tags__name')):
-            if doc.tag_name == 'Syllabus':
-                phile = doc
-                break
-        return phile
+        if not hasattr(self, '_syllabus'):
+            self._syllabus = self.docs.filter(kind='Syllabus').first()
+        return self._syllabus
 
     def comments(self):
         """Return annotation comments."""
-        return self.notes.filter(tags__name__in=['Comments'])
+        return self.notes.filter(kind='Comments')
 
     def adenda(self):
         """Return adenda comments."""
-        return self.notes.filter(tags__name__in=['Furbish', 'Adenda'])
+        return self.notes.filter(kind__in=['Furbish', 'Adenda'])
 
     def permissions(self, user):
-        status = in_group(user, settings.MANAGER_GROUP)
-        for outcome in self.outcome.all():
-            if user.groups.filter(name=outcome.group).exists():
-                status = True
-        return status
+        """Managers and members of the group of any of the course outcomes."""
+        if is_manager(user):
+            return True
+        if 'outcome' in getattr(self, '_prefetched_objects_cache', {}):
+            groups = {outcome.group_id for outcome in self.outcome.all()}
+        else:
+            groups = set(self.outcome.values_list('group_id', flat=True))
+        return not groups.isdisjoint(user_groups(user))
 
     def abilities(self):
         """Return abilities SLO."""
@@ -179,11 +256,9 @@ class Course(models.Model):
 
     def get_outcomes(self):
         """Get outcomes."""
-        outcomes = []
-        for outcome in self.outcome.all():
-            oc = OutcomeCourse.objects.get(outcome=outcome, course=self)
-            outcomes.append(oc)
-        return outcomes
+        return list(
+            self.outcomecourse_set.select_related('outcome').order_by('outcome__name'),
+        )
 
     def perspectives(self):
         """Return perspective SLO."""
@@ -191,27 +266,177 @@ class Course(models.Model):
 
     def outcomes_status(self, field):
         """Check if all outcomes are approved."""
-        status = False
-        outcomes = self.outcome.all().count()
-        count = 0
-        for outcome in self.outcome.all():
-            oc = OutcomeCourse.objects.get(outcome=outcome, course=self)
-            if getattr(oc, field):
-                count += 1
-        if count >= outcomes:
-            status = True
-        return status
+        counts = self.outcomecourse_set.aggregate(
+            total=models.Count('id'),
+            count=models.Count('id', filter=models.Q(**{field: True})),
+        )
+        return counts['count'] >= counts['total']
 
     def set_outcome(self, state, status, date):
         """Set outcome status."""
-        for outcome in self.outcome.all():
-            outcome_course = OutcomeCourse.objects.get(outcome=outcome, course=self)
-            if state == 'approve':
-                outcome_course.approved = status
-                outcome_course.approved_date = date
-            if state == 'furbish':
-                outcome_course.furbish = status
-            outcome_course.save()
+        fields = {}
+        if state == 'approve':
+            fields = {'approved': status, 'approved_date': date}
+        if state == 'furbish':
+            fields = {'furbish': status}
+        if fields:
+            fields['updated_at'] = datetime.datetime.now()
+            self.outcomecourse_set.update(**fields)
+            outcomes_updated.send(sender=OutcomeCourse, course=self, fields=fields)
+
+    def set_crosslist(self, numbers, doc=None):
+        """Create or remove cross-listed copies so they match the numbers."""
+        numbers = [number for number in dict.fromkeys(numbers) if number]
+        now = datetime.datetime.now()
+        with transaction.atomic():
+            existing = {cl.number: cl for cl in self.cross_listing.all()}
+            stale = [cl.id for number, cl in existing.items() if number not in numbers]
+            if stale:
+                Course.objects.filter(id__in=stale).delete()
+            kept = [cl for number, cl in existing.items() if number in numbers]
+            outcome_ids = set(
+                self.outcomecourse_set.values_list('outcome_id', flat=True),
+            )
+            if kept:
+                Course.objects.filter(id__in=[cl.id for cl in kept]).update(
+                    title=self.title,
+                    multipass=self.multipass,
+                    user=self.user,
+                    updated_by=self.updated_by,
+                    updated_at=now,
+                )
+                current = {cl.id: set() for cl in kept}
+                for cid, oid in OutcomeCourse.objects.filter(
+                    course__in=kept,
+                ).values_list('course_id', 'outcome_id'):
+                    current[cid].add(oid)
+                for cl in kept:
+                    if current[cl.id] != outcome_ids:
+                        cl.outcome.set(outcome_ids)
+                # update() and the syllabus update below send no signals
+                touch_courses(cl.id for cl in kept)
+            # new copies: inserted one at a time because MySQL does not
+            # return primary keys from bulk_create, then their outcomes and
+            # SLO rows in bulk (bulk_create does not fire m2m_changed).
+            fields = [
+                field for field in Course._meta.concrete_fields
+                if not field.primary_key
+            ]
+            clones = []
+            for number in numbers:
+                if number not in existing:
+                    clone = Course(**{
+                        field.attname: getattr(self, field.attname)
+                        for field in fields
+                    })
+                    clone.number = number
+                    clone.save()
+                    clones.append(clone)
+            if clones:
+                self.cross_listing.add(*clones)
+                OutcomeCourse.objects.bulk_create([
+                    OutcomeCourse(course=clone, outcome_id=oid)
+                    for clone in clones for oid in outcome_ids
+                ])
+                elements = list(OutcomeElement.objects.filter(outcome__in=outcome_ids))
+                CourseOutcome.objects.bulk_create([
+                    CourseOutcome(course=clone, slo=element)
+                    for clone in clones for element in elements
+                ])
+            if doc is not None:
+                # every copy points at the syllabus file already stored for
+                # the parent course rather than uploading it again.
+                replaced = Document.objects.filter(
+                    course__in=kept, kind='Syllabus',
+                ).values_list('course_id', *DOCUMENT_FILES)
+                with_syllabus = {row[0] for row in replaced}
+                Document.objects.filter(
+                    course__in=with_syllabus, kind='Syllabus',
+                ).update(
+                    name=doc.name,
+                    phile=doc.phile.name,
+                    sha256=doc.sha256,
+                    pages=doc.pages,
+                    preview=doc.preview.name,
+                    updated_by=doc.updated_by,
+                    updated_at=now,
+                )
+                # a queryset update sends no signals
+                release_files({
+                    field: [row[index] for row in replaced]
+                    for index, field in enumerate(DOCUMENT_FILES, 1)
+                })
+                docs = []
+                for clone in clones + kept:
+                    if clone.id not in with_syllabus:
+                        syllabus = Document(
+                            course=clone,
+                            name=doc.name,
+                            phile=doc.phile.name,
+                            sha256=doc.sha256,
+                            pages=doc.pages,
+                            preview=doc.preview.name,
+                            created_by=doc.created_by,
+                            updated_by=doc.updated_by,
+                            kind='Syllabus',
+                        )
+                        syllabus.save()
+                        docs.append(syllabus)
+                if docs:
+                    tag, created = Tag.objects.get_or_create(name='Syllabus')
+                    TaggedItem.objects.bulk_create([
+                        TaggedItem(content_object=syllabus, tag=tag)
+                        for syllabus in docs
+                    ])
+
+    def propagate_outcomes(self, note=None):
+        """Copy SLO descriptions and the adenda note to cross-listed courses."""
+        crosslist = list(self.cross_listing.all())
+        if not crosslist:
+            return
+        descriptions = dict(self.outcomes.values_list('slo_id', 'description'))
+        changed = []
+        for slo in CourseOutcome.objects.filter(
+            course__in=crosslist, slo__in=descriptions.keys(),
+        ):
+            if slo.description != descriptions[slo.slo_id]:
+                slo.description = descriptions[slo.slo_id]
+                changed.append(slo)
+        CourseOutcome.objects.bulk_update(changed, ['description'])
+        touch_courses({slo.course_id for slo in changed})
+        if note is not None:
+            adenda = Annotation.objects.filter(course__in=crosslist, kind='Adenda')
+            with_note = set(adenda.values_list('course_id', flat=True))
+            adenda.update(
+                body=note.body,
+                updated_by=note.updated_by,
+                updated_at=datetime.datetime.now(),
+            )
+            touch_courses(with_note)
+            missing = [cl.id for cl in crosslist if cl.id not in with_note]
+            if missing:
+                Annotation.objects.bulk_create([
+                    Annotation(
+                        course_id=cid,
+                        body=note.body,
+                        created_by=note.created_by,
+                        updated_by=note.updated_by,
+                        kind='Adenda',
+                    )
+                    for cid in missing
+                ])
+                # MySQL does not return primary keys from bulk_create
+                created = Annotation.objects.filter(
+                    course__in=missing, kind='Adenda',
+                ).values_list('id', flat=True)
+                tag, new_tag = Tag.objects.get_or_create(name='Adenda')
+                content_type = ContentType.objects.get_for_model(Annotation)
+                TaggedItem.objects.bulk_create([
+                    TaggedItem(content_type=content_type, object_id=aid, tag=tag)
+                    for aid in created
+                ])
+                # bulk_create sends no post_save
+                touch_courses(missing)
 
     def wellness(self):
         """Return wellnesse SLO."""
@@ -238,6 +463,7 @@ class OutcomeCourse(models.Model):
         on_delete=models.CASCADE,
     )
     course = models.ForeignKey(Course, on_delete=models.CASCADE)
+    updated_at = models.DateTimeField("Date Updated", auto_now=True, null=True)
     approved = models.BooleanField(default=False)
     approved_date = models.DateField(null=True, blank=True)
     furbish = models.BooleanField(
@@ -247,11 +473,29 @@ class OutcomeCourse(models.Model):
 
     class Meta:
         db_table = 'geoc_course_outcome'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['course', 'outcome'],
+                name='geoc_course_outcome_unique',
+            ),
+        ]
 
     def __str__(self):
         """Default data for display."""
         return '{0} ({1}): {2}'.format(self.course, self.course.id, self.outcome)
 
+    @classmethod
+    def index(cls, courses):
+        """Map (course_id, outcome_id) to OutcomeCourse for a set of courses."""
+        courses = {course.id: course for course in courses}
+        index = {}
+        for oc in cls.objects.filter(course__in=courses.keys()):
+            # reuse the course we already have so is_approved/is_furbished
+            # do not fetch it again.
+            oc.course = courses[oc.course_id]
+            index[(oc.course_id, oc.outcome_id)] = oc
+        return index
+
     def is_approved(self):
         status = False
         if self.course.approved or self.approved:
@@ -306,6 +550,14 @@ class CourseOutcome(models.Model):
         blank=True,
     )
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['course', 'slo'],
+                name='geoc_courseoutcome_unique',
+            ),
+        ]
+
     def __str__(self):
         """Default data for display."""
         return '[{0} ({1})] {2}: {3}'.format(
@@ -344,17 +596,55 @@ class Document(models.Model):
     phile = models.FileField(
         "Supporting documentation",
         upload_to=upload_to_path,
+        storage=blob_storage,
         validators=settings.FILE_VALIDATORS,
         max_length=767,
         help_text="PDF format",
         null=True,
         blank=True,
     )
+    kind = models.CharField(
+        max_length=16,
+        choices=KIND_CHOICES,
+        default='',
+        blank=True,
+        editable=False,
+    )
+    # filled in by manage.py process_documents after the upload
+    sha256 = models.CharField(max_length=64, blank=True, editable=False)
+    pages = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    preview = models.FileField(
+        upload_to='files/course/previews/',
+        max_length=767,
+        null=True,
+        blank=True,
+        editable=False,
+    )
     tags = TaggableManager(blank=True)
 
     class Meta:
         ordering  = ['created_at']
         get_latest_by = 'created_at'
+        indexes = [models.Index(fields=['course', 'kind'])]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """Remember the stored file names, to release them when replaced."""
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_files = {
+            field: instance.__dict__[field] or ''
+            for field in DOCUMENT_FILES if field in instance.__dict__
+        }
+        return instance
+
+    def save(self, *args, **kwargs):
+        """Save in a transaction, so a reused blob is checked after the row.
+
+        See BlobStorage.restore; inside an outer transaction this adds no
+        queries.
+        """
+        with transaction.atomic(savepoint=False):
+            super().save(*args, **kwargs)
 
     def get_slug(self):
         """Return the slug value for this data model class."""
@@ -400,10 +690,21 @@ class Annotation(models.Model):
     updated_at = models.DateTimeField("Date Updated", auto_now=True)
     body = models.TextField()
     status = models.BooleanField(default=True, verbose_name="Active?")
+    kind = models.CharField(
+        max_length=16,
+        choices=KIND_CHOICES,
+        default='',
+        blank=True,
+        editable=False,
+    )
     tags = TaggableManager(blank=True)
 
     class Meta:
         ordering = ('-created_at',)
+        indexes = [
+            models.Index(fields=['course', 'created_at']),
+            models.Index(fields=['course', 'kind']),
+        ]
 
     def __str__(self):
         """Default data for display."""
@@ -426,16 +727,224 @@ def approved_date(sender, instance, created, **kwargs):
 
 @receiver(models.signals.m2m_changed, sender=Course.outcome.through)
 def signal_function(sender, instance, action, **kwargs):
+    """Create or remove the SLO rows for the outcomes added to a course."""
     ids = kwargs.get('pk_set')
-    for sid in ids:
-        outcome = Outcome.objects.get(pk=sid)
-        if action == 'post_add':
-            for element in outcome.elements.all():
-                slo = CourseOutcome(course=instance, slo=element)
-                slo.save()
-                element.slo.add(slo)
-                element.save()
-        if action == 'pre_remove':
-            for element in outcome.elements.all():
-                slo = element.get_slo(instance)
-                slo.delete()
+    if action == 'post_add':
+        CourseOutcome.objects.bulk_create([
+            CourseOutcome(course=instance, slo=element)
+            for element in OutcomeElement.objects.filter(outcome__in=ids)
+        ], ignore_conflicts=True)
+    if action == 'pre_remove':
+        CourseOutcome.objects.filter(course=instance, slo__outcome__in=ids).delete()
+
+
+def outcome_tags():
+    """Map each outcome id to the set of its tag names.
+
+    The map is built once per process and rebuilt when the version stamp in
+    the shared cache changes, so every worker picks up tag changes.
+    """
+    version = cache.get(OUTCOME_TAGS_VERSION)
+    if OUTCOME_TAGS['index'] is None or OUTCOME_TAGS['version'] != version:
+        index = {}
+        for oid, name in Outcome.objects.values_list('id', 'tags__name'):
+            index.setdefault(oid, set())
+            if name:
+                index[oid].add(name)
+        OUTCOME_TAGS['index'] = index
+        OUTCOME_TAGS['version'] = version
+    return OUTCOME_TAGS['index']
+
+
+@receiver(models.signals.post_save, sender=Outcome)
+@receiver(models.signals.post_delete, sender=Outcome)
+@receiver(models.signals.post_save, sender=Tag)
+@receiver(models.signals.post_delete, sender=Tag)
+@receiver(models.signals.m2m_changed, sender=TaggedItem)
+def outcome_tags_changed(sender, **kwargs):
+    """Invalidate the outcome tag index in this and every other process."""
+    instance = kwargs.get('instance')
+    if sender is TaggedItem:
+        if not isinstance(instance, Outcome) or kwargs['action'].startswith('pre_'):
+            return
+    OUTCOME_TAGS['index'] = None
+    cache.set(OUTCOME_TAGS_VERSION, uuid.uuid4().hex, None)
+
+
+def course_versions(ids):
+    """Version stamp of the table rows for each course, keyed by course id.
+
+    A course without a stamp (new, touched or evicted) gets a fresh one, so
+    rows cached under the old stamp are never used again.
+    """
+    keys = {cid: COURSE_VERSION.format(cid) for cid in ids}
+    found = cache.get_many(keys.values())
+    fresh = {key: uuid.uuid4().hex for key in keys.values() if key not in found}
+    if fresh:
+        cache.set_many(fresh, None)
+        found.update(fresh)
+    return {cid: found[key] for cid, key in keys.items()}
+
+
+def touch_courses(ids):
+    """Drop the version stamps of courses so their rows are rendered again.
+
+    Waits for the surrounding transaction to commit; dropped any earlier, a
+    concurrent request could render a row from the data as it was before and
+    cache it under the new stamp for good.
+    """
+    keys = [COURSE_VERSION.format(cid) for cid in ids]
+    if keys:
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+@receiver(models.signals.post_save, sender=Course)
+def course_saved(sender, instance, created, **kwargs):
+    """Rebuild the row of a course, and those listing it if its number moved."""
+    ids = [instance.id]
+    if not created and instance.number != getattr(instance, '_loaded_number', None):
+        ids.extend(instance.cross_listing.values_list('id', flat=True))
+        instance._loaded_number = instance.number
+    touch_courses(ids)
+
+
+@receiver(models.signals.pre_delete, sender=Course)
+def course_deleted(sender, instance, **kwargs):
+    """Rebuild the rows that list a course about to be deleted."""
+    touch_courses(
+        [instance.id] + list(instance.cross_listing.values_list('id', flat=True)),
+    )
+
+
+@receiver(models.signals.post_save, sender=OutcomeCourse)
+@receiver(models.signals.post_delete, sender=OutcomeCourse)
+@receiver(models.signals.post_save, sender=Document)
+@receiver(models.signals.post_delete, sender=Document)
+@receiver(models.signals.post_save, sender=Annotation)
+@receiver(models.signals.post_delete, sender=Annotation)
+def course_part_changed(sender, instance, **kwargs):
+    """Rebuild the rows of the course an outcome, document or note belongs to."""
+    touch_courses([instance.course_id])
+
+
+@receiver(models.signals.post_save, sender=Group)
+@receiver(models.signals.post_save, sender=Outcome)
+@receiver(models.signals.post_save, sender=OutcomeElement)
+@receiver(models.signals.post_delete, sender=OutcomeElement)
+def outcome_changed(sender, instance, **kwargs):
+    """Rebuild the rows of the courses showing an outcome, its SLOs or group."""
+    if sender is Group:
+        courses = OutcomeCourse.objects.filter(outcome__group=instance)
+    elif sender is Outcome:
+        courses = OutcomeCourse.objects.filter(outcome=instance)
+    else:
+        courses = OutcomeCourse.objects.filter(outcome_id=instance.outcome_id)
+    touch_courses(set(courses.values_list('course_id', flat=True)))
+
+
+def tag_kind(names):
+    """The kind for a set of tag names, blank if none of them is a kind."""
+    return next((kind for kind, label in KIND_CHOICES if kind in names), '')
+
+
+@receiver(models.signals.m2m_changed, sender=TaggedItem)
+def part_kind_tagged(sender, instance, action, **kwargs):
+    """Keep the kind of a document or note in step with its tags."""
+    if isinstance(instance, (Document, Annotation)) and action.startswith('post_'):
+        kind = tag_kind(set(instance.tags.values_list('name', flat=True)))
+        if kind != instance.kind:
+            type(instance).objects.filter(pk=instance.pk).update(kind=kind)
+            instance.kind = kind
+
+
+def release_files(names):
+    """Remove document files once no document names them.
+
+    names maps a file field of Document to the names that were dropped from
+    it. Cross-listed copies and identical uploads share one blob, so the count
+    of documents naming a file is its reference count. Nothing is removed
+    until the surrounding transaction commits, and a file is set aside and
+    counted again before it goes: a document that reused it and committed in
+    between gets it back, one that commits later restores it itself (see
+    BlobStorage.restore).
+    """
+    def clean_up():
+        for field, dropped in names.items():
+            storage = Document._meta.get_field(field).storage
+            for name in set(dropped):
+                if not name or Document.objects.filter(**{field: name}).exists():
+                    continue
+                path = storage.path(name)
+                aside = '{0}.released'.format(path)
+                try:
+                    os.rename(path, aside)
+                except FileNotFoundError:
+                    continue
+                if Document.objects.filter(**{field: name}).exists():
+                    os.replace(aside, path)
+                else:
+                    os.remove(aside)
+    transaction.on_commit(clean_up)
+
+
+@receiver(models.signals.pre_save, sender=Document)
+def document_replaced(sender, instance, update_fields=None, **kwargs):
+    """Release the file and preview a document is about to stop naming."""
+    loaded = getattr(instance, '_loaded_files', None)
+    if loaded is None:
+        return
+    dropped = {}
+    for field, name in loaded.items():
+        if update_fields is not None and field not in update_fields:
+            continue
+        current = getattr(instance, field).name or ''
+        if current != name:
+            dropped[field] = [name]
+            loaded[field] = current
+    if dropped:
+        release_files(dropped)
+
+
+@receiver(models.signals.post_delete, sender=Document)
+def document_deleted(sender, instance, **kwargs):
+    """Release the file and preview of a deleted document."""
+    release_files({
+        field: [getattr(instance, field).name] for field in DOCUMENT_FILES
+    })
+
+
+@receiver(models.signals.m2m_changed, sender=TaggedItem)
+def course_part_tagged(sender, instance, action, **kwargs):
+    """Tags decide which document is the syllabus."""
+    if isinstance(instance, (Document, Annotation)) and action.startswith('post_'):
+        touch_courses([instance.course_id])
+
+
+@receiver(models.signals.m2m_changed, sender=Course.outcome.through)
+@receiver(models.signals.m2m_changed, sender=Course.cross_listing.through)
+def course_links_changed(sender, instance, action, pk_set=None, **kwargs):
+    """Rebuild rows when outcomes or cross-listings are added or removed."""
+    if not action.startswith('post_'):
+        return
+    ids = set()
+    if isinstance(instance, Course):
+        ids.add(instance.id)
+    if sender is Course.cross_listing.through or not isinstance(instance, Course):
+        ids.update(pk_set or [])
+    touch_courses(ids)
+
+
+@receiver(outcomes_updated)
+def course_outcomes_updated(sender, course, **kwargs):
+    """set_outcome() updates OutcomeCourse rows without post_save."""
+    touch_courses([course.id])
+
+
+@receiver(models.signals.post_save, sender=User)
+def course_user_changed(sender, instance, **kwargs):
+    """Rows show the name and email of the faculty member."""
+    if kwargs.get('created'):
+        return
+    if kwargs.get('update_fields') == frozenset(['last_login']):
+        return
+    touch_courses(instance.created_by.values_list('id', flat=True))
@@ -0,0 +1,10 @@
+# -*- coding: utf-8 -*-
+
+"""Custom signals."""
+
+from django.dispatch import Signal
+
+
+# sent after a queryset update() of the OutcomeCourse rows for a course,
+# since update() bypasses post_save. arguments: course, fields
+outcomes_updated = Signal()
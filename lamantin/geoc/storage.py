@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+
+"""Content addressed file storage for course documents."""
+
+import hashlib
+import os
+import tempfile
+
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.utils.deconstruct import deconstructible
+
+
+# every distinct document is stored once under its SHA-256
+BLOB_DIR = 'files/course/blobs/'
+
+
+def file_digest(phile):
+    """SHA-256 of an open file or a path, read in chunks."""
+    digest = hashlib.sha256()
+    if isinstance(phile, str):
+        with open(phile, 'rb') as handle:
+            for piece in iter(lambda: handle.read(1024 * 1024), b''):
+                digest.update(piece)
+    else:
+        if hasattr(phile, 'seek'):
+            phile.seek(0)
+        for piece in phile.chunks():
+            digest.update(piece)
+        if hasattr(phile, 'seek'):
+            phile.seek(0)
+    return digest.hexdigest()
+
+
+def blob_name(digest, filename):
+    """Storage name of the blob with a digest, keeping the file extension."""
+    extension = os.path.splitext(filename)[1].lower()
+    return '{0}{1}/{2}{3}'.format(BLOB_DIR, digest[:2], digest, extension)
+
+
+@deconstructible
+class BlobStorage(FileSystemStorage):
+    """Store each distinct file once, named by the hash of its content.
+
+    Saving a file that is already stored writes nothing and hands back the
+    existing name, so cross-listed copies and re-uploads of the same syllabus
+    share one blob. Blobs are removed with the last document naming them,
+    see geoc.models.release_files.
+    """
+
+    def _save(self, name, content):
+        """Write the blob unless an identical one is already stored."""
+        name = blob_name(file_digest(content), name)
+        if self.exists(name):
+            transaction.on_commit(lambda: self.restore(name, content))
+            return name
+        return super()._save(name, content)
+
+    def restore(self, name, content):
+        """Write a reused blob again if it was released in the meantime.
+
+        release_files cannot see a document that has not committed yet, so
+        it may remove a blob such a document has just reused; the document
+        checks once it commits and puts the file back.
+        """
+        if self.exists(name):
+            return
+        path = self.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # written aside and renamed, so a blob is never seen half written
+        with tempfile.NamedTemporaryFile(
+            dir=os.path.dirname(path), delete=False,
+        ) as handle:
+            for piece in content.chunks():
+                handle.write(piece)
+        if self.file_permissions_mode is not None:
+            os.chmod(handle.name, self.file_permissions_mode)
+        os.replace(handle.name, path)
+
+
+blob_storage = BlobStorage()
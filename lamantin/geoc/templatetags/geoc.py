@@ -7,8 +7,12 @@ from lamantin.geoc.models import OutcomeCourse
 register = template.Library()
 
 
-@register.simple_tag
-def get_outcome(course, outcome):
+@register.simple_tag(takes_context=True)
+def get_outcome(context, course, outcome):
+    """Obtain the OutcomeCourse for a course, from outcome_index if provided."""
+    index = context.get('outcome_index')
+    if index is not None:
+        return index.get((course.id, outcome.id))
     try:
         oc = OutcomeCourse.objects.get(outcome=outcome, course=course)
     except Exception:
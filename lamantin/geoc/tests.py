@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+
+"""Query budgets and status codes of the main views."""
+
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from lamantin.geoc.management.commands.query_budgets import query_budget
+from lamantin.geoc.management.commands.query_budgets import scenarios
+
+
+@override_settings(
+    CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }},
+    LAMANTIN_INSTRUMENTATION=False,
+)
+class QueryBudgetTest(TestCase):
+    """Every view of the query_budgets benchmark, on a small catalogue.
+
+    Each view is requested with a cold cache, the worst case, and has to
+    answer with the expected status within its LAMANTIN_QUERY_BUDGETS entry.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        """The same catalogue the benchmark generates."""
+        call_command('synthetic_catalogue', courses=100, seed=1, stdout=StringIO())
+
+    def setUp(self):
+        """Start every test from an empty cache."""
+        cache.clear()
+
+    def test_views(self):
+        """Status and query count of each view."""
+        for name, method, path, data, user, status in scenarios():
+            with self.subTest(view=name, method=method):
+                budget = query_budget(name)
+                self.assertIsNotNone(budget, 'no query budget for {0}'.format(name))
+                self.client.force_login(user)
+                with CaptureQueriesContext(connection) as queries:
+                    response = getattr(self.client, method)(path, data)
+                self.assertEqual(response.status_code, status)
+                self.assertLessEqual(
+                    len(queries),
+                    budget,
+                    '{0} {1} ran {2} queries'.format(method.upper(), name, len(queries)),
+                )
+
+    def test_cached_views(self):
+        """A second request for a page never costs more than the first."""
+        for name, method, path, data, user, status in scenarios():
+            if method != 'get':
+                continue
+            with self.subTest(view=name):
+                cache.clear()
+                self.client.force_login(user)
+                with CaptureQueriesContext(connection) as cold:
+                    getattr(self.client, method)(path, data)
+                with CaptureQueriesContext(connection) as warm:
+                    response = getattr(self.client, method)(path, data)
+                self.assertEqual(response.status_code, status)
+                self.assertLessEqual(len(warm), len(cold))
+                self.assertLessEqual(len(warm), query_budget(name))
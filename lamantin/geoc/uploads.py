@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+
+"""Resumable document uploads and the background stage that follows them."""
+
+import logging
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.core.files.base import File
+from django.db import transaction
+from lamantin.geoc.storage import blob_name
+from lamantin.geoc.storage import file_digest
+
+
+logger = logging.getLogger('debug_logfile')
+# upload ids are made by the browser, so accept nothing that could be a path
+UPLOAD_ID = re.compile(r'^[0-9a-f]{32}$')
+
+
+def partial_path(user, upload):
+    """Where the parts of an upload collect, in a directory per user."""
+    if not upload or not UPLOAD_ID.match(upload):
+        raise ValueError('invalid upload id: {0}'.format(upload))
+    return os.path.join(
+        settings.UPLOAD_PARTIAL_DIR, str(user.id), '{0}.part'.format(upload),
+    )
+
+
+def partial_size(path):
+    """Bytes received so far for an upload, 0 if it has not started."""
+    try:
+        return os.path.getsize(path)
+    except FileNotFoundError:
+        return 0
+
+
+def append_chunk(path, chunk):
+    """Write an uploaded part to the end of the partial file."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'ab') as phile:
+        for piece in chunk.chunks():
+            phile.write(piece)
+
+
+def finish_upload(path, doc, filename):
+    """Move a complete upload into doc.phile and save the document.
+
+    The file is checked with FILE_VALIDATORS under its original name, then
+    stored by content hash like any other document. A new blob is renamed
+    into place rather than copied, which is why UPLOAD_PARTIAL_DIR should be
+    on the same filesystem as MEDIA_ROOT; a file that is already stored is
+    dropped once the document commits. Raises ValidationError, and keeps nothing, if a check
+    fails.
+    """
+    field = doc._meta.get_field('phile')
+    filename = os.path.basename(filename or 'upload')
+    try:
+        with open(path, 'rb') as phile:
+            field.run_validators(File(phile, name=filename))
+    except ValidationError:
+        os.remove(path)
+        raise
+    # doc.sha256 stays blank so process_documents picks the document up
+    name = blob_name(file_digest(path), filename)
+    reused = field.storage.exists(name)
+    if not reused:
+        target = field.storage.path(name)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        shutil.move(path, target)
+        if settings.FILE_UPLOAD_PERMISSIONS is not None:
+            os.chmod(target, settings.FILE_UPLOAD_PERMISSIONS)
+    doc.phile = name
+    doc.save()
+    if reused:
+        transaction.on_commit(lambda: drop_upload(path, name, field.storage))
+    return doc
+
+
+def drop_upload(path, name, storage):
+    """Remove a complete upload whose blob was already stored.
+
+    Runs once the document commits, and first puts the blob back if it was
+    released in the meantime, see BlobStorage.restore.
+    """
+    with open(path, 'rb') as phile:
+        storage.restore(name, File(phile))
+    os.remove(path)
+
+
+def clear_partials(age):
+    """Remove partial uploads untouched for age seconds; returns the count."""
+    removed = 0
+    cutoff = time.time() - age
+    for root, dirs, philes in os.walk(settings.UPLOAD_PARTIAL_DIR):
+        for name in philes:
+            path = os.path.join(root, name)
+            if name.endswith('.part') and os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                removed += 1
+    return removed
+
+
+def pdf_pages(path):
+    """Page count of a PDF from pdfinfo, None if it cannot be read."""
+    try:
+        info = subprocess.run(
+            ['pdfinfo', path],
+            capture_output=True,
+            check=True,
+            text=True,
+            timeout=60,
+        ).stdout
+    except (OSError, subprocess.SubprocessError) as error:
+        logger.debug('pdfinfo {0}: {1}'.format(path, error))
+        return None
+    match = re.search(r'^Pages:\s+(\d+)', info, re.MULTILINE)
+    return int(match.group(1)) if match else None
+
+
+def pdf_preview(path):
+    """PNG of the first page of a PDF from pdftoppm, None on failure."""
+    with tempfile.TemporaryDirectory() as folder:
+        prefix = os.path.join(folder, 'preview')
+        try:
+            subprocess.run(
+                [
+                    'pdftoppm', '-png', '-singlefile', '-f', '1', '-l', '1',
+                    '-scale-to-x', str(settings.DOCUMENT_PREVIEW_WIDTH),
+                    '-scale-to-y', '-1',
+                    path, prefix,
+                ],
+                capture_output=True,
+                check=True,
+                timeout=60,
+            )
+            with open('{0}.png'.format(prefix), 'rb') as phile:
+                return phile.read()
+        except (OSError, subprocess.SubprocessError) as error:
+            logger.debug('pdftoppm {0}: {1}'.format(path, error))
+            return None
+
+
+def process_document(doc):
+    """Checksum a document and, for a PDF, count pages and draw a preview."""
+    with doc.phile.open('rb') as phile:
+        doc.sha256 = file_digest(phile)
+    # identical files share a blob, so reuse what was worked out for it
+    twin = type(doc).objects.filter(
+        sha256=doc.sha256, pages__isnull=False,
+    ).exclude(pk=doc.pk).first()
+    if twin:
+        doc.pages = twin.pages
+        doc.preview = twin.preview.name
+    elif doc.phile.name.lower().endswith('.pdf'):
+        path = doc.phile.path
+        doc.pages = pdf_pages(path)
+        preview = pdf_preview(path)
+        if preview:
+            doc.preview.save(
+                '{0}.png'.format(doc.id), ContentFile(preview), save=False,
+            )
+    # updated_at moves too, so cached detail pages show the preview
+    doc.save(update_fields=['sha256', 'pages', 'preview', 'updated_at'])
+    return doc
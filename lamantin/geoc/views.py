@@ -2,22 +2,23 @@
 
 """URLs for all views."""
 
-import copy
-
 from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
-from django.contrib.auth.models import User
+from django.db import transaction
 from django.http import HttpResponseRedirect
 from django.shortcuts import get_object_or_404
 from django.shortcuts import render
 from django.urls import reverse_lazy
-from djtools.utils.mail import send_mail
+from lamantin.core.mail import manager_emails
+from lamantin.core.mail import queue_mail
 from lamantin.geoc.forms import AnnotationForm
 from lamantin.geoc.forms import CourseForm
-from lamantin.geoc.forms import CourseOutcomeForm
+from lamantin.geoc.forms import CourseOutcomeFormSet
 from lamantin.geoc.forms import DocumentForm
 from lamantin.geoc.models import Course
+from lamantin.geoc.models import CourseOutcome
+from lamantin.geoc.models import touch_courses
 
 
 @login_required
@@ -37,47 +38,32 @@ def course_create(request):
             prefix='syllabus',
         )
         if form.is_valid() and form_syllabus.is_valid():
-            course = form.save(commit=False)
-            course.user = user
-            course.updated_by = user
-            course.save()
-            form.save_m2m()
-            # document syllabus
-            doc = form_syllabus.save(commit=False)
-            doc.course = course
-            if not doc.name:
-                doc.name = 'Syllabus: {0} ({1})'.format(course.title, course.number)
-            doc.created_by = user
-            doc.updated_by = user
-            doc.save()
-            doc.tags.add('Syllabus')
-            if course.multipass:
-                crosslist_dict = {
-                    'crosslist1': request.POST.get('crosslist1'),
-                    'crosslist2': request.POST.get('crosslist2'),
-                    'crosslist3': request.POST.get('crosslist3'),
-                    'crosslist4': request.POST.get('crosslist4'),
-                }
-                slos = course.outcome.all()
-                for key, value in crosslist_dict.items():
-                    if value:
-                        #course.pk = None
-                        #course._state.adding = True
-                        #course.number = value
-                        #course.save()
-                        #course.outcome.set(slos)
-                        crosslist = copy.deepcopy(course)
-                        crosslist.id = None
-                        crosslist.number = value
-                        crosslist.save()
-                        crosslist.outcome.set(slos)
-                        course.cross_listing.add(crosslist)
-                        # doc
-                        doc.pk = None
-                        doc.course = crosslist
-                        doc._state.adding = True
-                        doc.save()
-                        doc.tags.add('Syllabus')
+            with transaction.atomic():
+                course = form.save(commit=False)
+                course.user = user
+                course.updated_by = user
+                course.save()
+                form.save_m2m()
+                # document syllabus
+                doc = form_syllabus.save(commit=False)
+                doc.course = course
+                if not doc.name:
+                    doc.name = 'Syllabus: {0} ({1})'.format(course.title, course.number)
+                doc.created_by = user
+                doc.updated_by = user
+                doc.kind = 'Syllabus'
+                doc.save()
+                doc.tags.add('Syllabus')
+                if course.multipass:
+                    course.set_crosslist(
+                        [
+                            post.get('crosslist1'),
+                            post.get('crosslist2'),
+                            post.get('crosslist3'),
+                            post.get('crosslist4'),
+                        ],
+                        doc,
+                    )
             messages.add_message(
                 request,
                 messages.SUCCESS,
@@ -109,7 +95,6 @@ def course_create(request):
 def course_update(request, cid):
     """GEOC workflow form to update a course."""
     course = get_object_or_404(Course, pk=cid)
-    syllabus = None
     user = request.user
     if course.save_submit:
         messages.add_message(
@@ -143,8 +128,7 @@ def course_update(request, cid):
         )
         return HttpResponseRedirect(reverse_lazy('dashboard_home'))
 
-    if course.syllabus():
-        syllabus = course.syllabus()
+    syllabus = course.syllabus()
 
     if request.method == 'POST':
         post = request.POST
@@ -161,49 +145,32 @@ def course_update(request, cid):
             prefix='syllabus',
         )
         if form.is_valid() and form_syllabus.is_valid():
-            course = form.save(commit=False)
-            course.user = user
-            course.updated_by = user
-            course.save()
-            form.save_m2m()
-            # document syllabus
-            doc = form_syllabus.save(commit=False)
-            doc.course = course
-            if not doc.name:
-                doc.name = 'Syllabus: {0} ({1})'.format(course.title, course.number)
-            doc.created_by = user
-            doc.updated_by = user
-            doc.save()
-            doc.tags.add('Syllabus')
-            if course.multipass:
-                # obtain the SLOs from the parent course
-                slos = course.outcome.all()
-                # crosslist course
-                crosslist_dict = {
-                    'crosslist1': request.POST.get('crosslist1'),
-                    'crosslist2': request.POST.get('crosslist2'),
-                    'crosslist3': request.POST.get('crosslist3'),
-                    'crosslist4': request.POST.get('crosslist4'),
-                }
-                # remove all crosslisted courses first
-                for cl in course.cross_listing.all():
-                    cl.delete()
-                # recreate all crosslisted courses
-                for key, value in crosslist_dict.items():
-                    if value:
-                        crosslist = copy.deepcopy(course)
-                        crosslist.id = None
-                        crosslist.number = value
-                        crosslist.save()
-                        # add the SLOs from parent to child
-                        crosslist.outcome.set(slos)
-                        course.cross_listing.add(crosslist)
-                        # doc
-                        doc.pk = None
-                        doc.course = crosslist
-                        doc._state.adding = True
-                        doc.save()
-                        doc.tags.add('Syllabus')
+            with transaction.atomic():
+                course = form.save(commit=False)
+                course.user = user
+                course.updated_by = user
+                course.save()
+                form.save_m2m()
+                # document syllabus
+                doc = form_syllabus.save(commit=False)
+                doc.course = course
+                if not doc.name:
+                    doc.name = 'Syllabus: {0} ({1})'.format(course.title, course.number)
+                doc.created_by = user
+                doc.updated_by = user
+                doc.kind = 'Syllabus'
+                doc.save()
+                doc.tags.add('Syllabus')
+                if course.multipass:
+                    course.set_crosslist(
+                        [
+                            post.get('crosslist1'),
+                            post.get('crosslist2'),
+                            post.get('crosslist3'),
+                            post.get('crosslist4'),
+                        ],
+                        doc,
+                    )
             messages.add_message(
                 request,
                 messages.SUCCESS,
@@ -244,14 +211,13 @@ def course_update(request, cid):
 @login_required
 def outcome_form(request, cid):
     """GEOC workflow form to update a course."""
-    forms_dict = {}
     errors = False
     user = request.user
     form_note = None
     adendum = None
     phile = None
     course = get_object_or_404(Course, pk=cid)
-    adendum = course.notes.filter(tags__name__in=['Adenda']).first()
+    adendum = course.notes.filter(kind='Adenda').first()
     form_note = AnnotationForm(
         instance=adendum,
         use_required_attribute=settings.REQUIRED_ATTRIBUTE,
@@ -276,60 +242,51 @@ def outcome_form(request, cid):
         )
         return HttpResponseRedirect(reverse_lazy('dashboard_home'))
 
+    slos = CourseOutcome.objects.filter(
+        course=course, slo__outcome__active=True,
+    ).select_related('slo__outcome').order_by('slo__outcome__name', 'slo__id')
     if request.method == 'POST':
         post = request.POST
-        # SLOs
-        for outcome in course.outcome.all():
-            if outcome.active:
-                forms = []
-                for element in outcome.elements.all():
-                    slo = element.slo.get(course=course)
-                    form = CourseOutcomeForm(
-                        post,
-                        request=request,
-                        prefix='slo{0}'.format(slo.id),
-                        instance=slo,
-                    )
-                    if form.is_valid():
-                        form.save()
-                    else:
-                        errors = True
-                    # do we need this?
-                    forms.append(form)
-                forms_dict[outcome.get_form()] = forms
-        # note
-        form_note = AnnotationForm(
-            post,
-            instance=adendum,
-            use_required_attribute=settings.REQUIRED_ATTRIBUTE,
-        )
-        if adendum:
-            note = form_note.save()
-        elif form_note.is_valid():
-            note = form_note.save(commit=False)
-            note.course = course
-            note.created_by = user
-            note.updated_by = user
-            note.save()
-            note.tags.add('Adenda')
-        else:
-            note = None
-        # update crosslisted courses if need be:
-        if not errors and course.multipass:
-            # comments
-            if note:
-                for cl in course.cross_listing.all():
-                    cl_note = copy.deepcopy(note)
-                    cl_note.id = None
-                    cl_note.course = cl
-                    cl_note.save()
-                    cl_note.tags.add('Adenda')
-            # SLOs
-            for outcome in course.outcomes.all():
-                for cl in course.cross_listing.all():
-                    for cl_outcome in cl.outcomes.filter(slo=outcome.slo):
-                        cl_outcome.description = outcome.description
-                        cl_outcome.save()
+        with transaction.atomic():
+            # SLOs: save only the descriptions that changed, in one query
+            formset = CourseOutcomeFormSet(
+                post,
+                queryset=slos,
+                prefix='slo',
+                form_kwargs={'request': request},
+            )
+            errors = not formset.is_valid()
+            # edit_only does not stop a client posting extra forms, so only
+            # the existing rows are kept
+            changed = [
+                form.instance for form in formset
+                if form.instance.pk and form.is_valid() and form.has_changed()
+            ]
+            if changed:
+                CourseOutcome.objects.bulk_update(changed, ['description'])
+                # bulk_update sends no signals; the detail page shows SLOs
+                touch_courses([course.id])
+            # note
+            form_note = AnnotationForm(
+                post,
+                instance=adendum,
+                use_required_attribute=settings.REQUIRED_ATTRIBUTE,
+            )
+            if adendum:
+                note = form_note.save()
+            elif form_note.is_valid():
+                note = form_note.save(commit=False)
+                note.course = course
+                note.created_by = user
+                note.updated_by = user
+                note.kind = 'Adenda'
+                note.save()
+                note.tags.add('Adenda')
+            else:
+                note = None
+            # update crosslisted courses if need be:
+            if not errors and course.multipass:
+                course.propagate_outcomes(note)
 
         if not errors and post.get('save_submit') and not course.save_submit:
             # set the save submit flag so user cannot update
@@ -346,9 +303,7 @@ def outcome_form(request, cid):
                 extra_tags='alert-success',
             )
             subject = '[GEOC] {0} ({1})'.format(course.title, course.number)
-            managers = []
-            for man in User.objects.filter(groups__name='Managers'):
-                managers.append(man.email)
+            managers = manager_emails()
             if settings.DEBUG:
                 course.managers = managers
                 to_list = bcc = [settings.MANAGERS[0][1]]
@@ -356,8 +311,7 @@ def outcome_form(request, cid):
                 to_list = [course.user.email]
                 bcc = managers
             frum = course.user.email
-            send_mail(
-                request,
+            queue_mail(
                 to_list,
                 subject,
                 frum,
@@ -380,24 +334,25 @@ def outcome_form(request, cid):
             instance=adendum,
             use_required_attribute=settings.REQUIRED_ATTRIBUTE,
         )
-        for outcome in course.outcome.all():
-            if outcome.active:
-                forms = []
-                for element in outcome.elements.all():
-                    slo = element.slo.get(course=course)
-                    form = CourseOutcomeForm(
-                        prefix='slo{0}'.format(slo.id),
-                        request=request,
-                        instance=slo,
-                    )
-                    forms.append(form)
-                forms_dict[outcome.get_form()] = forms
+        formset = CourseOutcomeFormSet(
+            queryset=slos,
+            prefix='slo',
+            form_kwargs={'request': request},
+        )
+
+    # group the SLO forms under their outcome for display
+    outcomes = list(course.outcome.all())
+    for outcome in outcomes:
+        outcome.forms = [
+            form for form in formset if form.instance.slo.outcome_id == outcome.id
+        ]
 
     return render(
         request,
         'geoc/form_outcome.html',
         {
-            'form': form,
+            'formset': formset,
+            'outcomes': outcomes,
             'form_note': form_note,
             'errors': errors,
             'course': course,
@@ -82,6 +82,7 @@ INSTALLED_APPS = (
     'taggit',
 )
 MIDDLEWARE = (
+    'lamantin.core.middleware.QueryBudgetMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -173,6 +174,46 @@ SERVER_MAIL=''
 # app specific settings
 MANAGER_GROUP = ''
 REGISTRAR_EMAIL = ''
+# outbound email queue, delivered by manage.py send_outbox
+OUTBOX_BATCH_SIZE = 50
+OUTBOX_MAX_ATTEMPTS = 5
+OUTBOX_BACKOFF = 60
+# seconds a worker has to send the messages it claimed before they are due again
+OUTBOX_LEASE = 60 * 15
+# seconds to hold outcome/status notices for a per course digest; 0 is off
+OUTBOX_DIGEST_WINDOW = 0
+# seconds to keep rendered dashboard table rows; stale ones are never served
+DASHBOARD_ROW_CACHE_TIMEOUT = 60 * 60 * 24 * 7
+# courses read per query by the registrar export
+EXPORT_CHUNK_SIZE = 500
+# resumable document uploads: bytes per part, the largest file accepted and
+# where parts collect; keep that on the MEDIA_ROOT filesystem so that
+# finishing an upload is a rename
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+UPLOAD_MAX_SIZE = 1024 * 1024 * 200
+UPLOAD_PARTIAL_DIR = '{0}partial/'.format(MEDIA_ROOT)
+# seconds before process_documents removes an abandoned partial upload
+UPLOAD_PARTIAL_AGE = 60 * 60 * 24
+# pixel width of the first page previews made by process_documents
+DOCUMENT_PREVIEW_WIDTH = 240
+# who sends course documents after the permission check: 'X-Accel-Redirect'
+# (nginx), 'X-Sendfile' (Apache, lighttpd) or '' for Django itself. For nginx,
+# DOCUMENT_ACCEL_PREFIX is an internal location aliased to MEDIA_ROOT:
+#     location /protected/ { internal; alias /path/to/assets/; }
+DOCUMENT_SENDFILE = ''
+DOCUMENT_ACCEL_PREFIX = '/protected/'
+# per view query counts and timings in the debug log, see core.middleware
+LAMANTIN_INSTRUMENTATION = False
+LAMANTIN_QUERY_BUDGETS = {
+    'dashboard_home': 10,
+    'detail': 16,
+    'course_data': 12,
+    'designation_home': 8,
+    'courses': 8,
+    'outcome_course_data': 14,
+    'outcome_form': 26,
+    'status': 10,
+}
 SUMMERNOTE_THEME = 'bs4'
 # tests
 FACULTY_EXPLORATIONS = 0
@@ -50,7 +50,7 @@ $(function(){
     });
   });
   /* datatables initialization for vaccine verification data */
-  $('#courses').DataTable({
+  var $dataTable = {
     'lengthMenu': [
       [100, 250, 500, 1000, 2000, 5000, 10000],
       [100, 250, 500, 1000, 2000, 5000, 10000]
@@ -70,7 +70,46 @@ $(function(){
         }
       }
     ]
-  });
+  };
+  /* server-side paging, sorting and search when the table has a data source */
+  var $source = $('#courses').data('source');
+  if ($source) {
+    $.extend($dataTable, {
+      serverSide: true,
+      processing: true,
+      searchDelay: 400,
+      /* rows arrive as rendered <tr> markup: split them into cells and keep
+         the attributes of each <td> so createdRow can restore them */
+      ajax: function (data, callback, settings) {
+        $.getJSON($source, data, function (json) {
+          json.data = $.map(json.data, function (row) {
+            var $cells = [];
+            $cells.attrs = [];
+            $($.parseHTML(row)).filter('tr').children('td').each(function () {
+              var $attrs = {};
+              $.each(this.attributes, function () {
+                $attrs[this.name] = this.value;
+              });
+              $cells.push(this.innerHTML);
+              $cells.attrs.push($attrs);
+            });
+            return [$cells];
+          });
+          callback(json);
+        });
+      },
+      createdRow: function (row, data) {
+        $(row).children('td').each(function (i) {
+          $(this).attr(data.attrs[i] || {});
+        });
+      },
+      drawCallback: function () {
+        $('#courses [data-toggle="popover"]').popover();
+        $('#courses [data-toggle="tooltip"]').tooltip();
+      }
+    });
+  }
+  $('#courses').DataTable($dataTable);
   /* clear django cache object by cache key and refresh content */
   $('.clear-cache').on('click', function(e){
     e.preventDefault();